@@ -0,0 +1,383 @@
+"""Offline benchmarks for the camera pipeline.
+
+Usage:
+    python benchmark.py demosaic FRAME [--runs N] [--curve linear|gamma]
+    python benchmark.py demosaic --camera [--save FRAME] [--runs N]
+    python benchmark.py jitter [--mode threads|processes|both] [--workers N] [--rate FPS] [--seconds S] [--frame FRAME]
+    python benchmark.py dng [FRAME] [--runs N] [--rate FPS] [--out DIR]
+    python benchmark.py formats [FRAME] [--runs N] [--workers N] [--link-mbps MBPS]
+
+FRAME is a recorded raw Bayer frame: a .npy file (such as the frames the save
+queue spills into <transect>/.overflow) or a 16-bit PNG/TIFF. --camera grabs a
+frame from the first connected camera instead, which also times the VmbPy
+transform; stop the avt-camera service first so the camera is free.
+
+jitter saves frames at full resolution through the frame saver pool while the
+camera's trigger scheduler, set to a 10 ms interval, measures how late each
+deadline fires.
+
+dng times writing one frame as a DNG against the JPEG save path and compares
+both with the per-frame budget at the recording frame rate. Write to --out on
+the recording drive for realistic numbers.
+
+formats estimates the highest trigger rate each camera pixel format allows,
+from the GigE link time of its payload, the frame callback's copy or unpack
+into the raw pool and the JPEG save path spread over the saver workers.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from camera.bayer_packing import pack12, unpack12
+from camera.demosaic import OPENCV_BACKENDS, VMBPY_BACKEND, demosaic_bayer8, vmbpy_demosaic
+from camera.frame_pipeline import FramePipeline, bin_bayer
+from camera.tone_mapping import TONE_CURVES, ToneMapper
+from camera.trigger_scheduler import TriggerScheduler
+from dng_writer import DngWriter
+from exif_manager import ExifManager
+from frame_save_queue import FrameSaveQueue
+from frame_saver import FrameSaverPool
+from settings_manager import SettingsManager
+
+
+def load_bayer(path):
+    """Load a recorded raw frame as a 2D Bayer array"""
+    if path.endswith('.npy'):
+        bayer = np.load(path)
+    else:
+        bayer = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if bayer is None:
+            raise ValueError(f"Could not read {path}")
+    bayer = np.squeeze(bayer)
+    if bayer.ndim != 2:
+        raise ValueError(f"{path} is not a single-plane Bayer frame (shape {bayer.shape})")
+    # Keep whole Bayer quads
+    return np.ascontiguousarray(bayer[:bayer.shape[0] & ~1, :bayer.shape[1] & ~1])
+
+
+def grab_camera_frame():
+    """Grab one frame from the first camera. Returns (bayer, frame, camera context) with the camera still open."""
+    from vmbpy import VmbSystem
+    vmb = VmbSystem.get_instance()
+    vmb.__enter__()
+    cameras = vmb.get_all_cameras()
+    if not cameras:
+        vmb.__exit__(None, None, None)
+        raise RuntimeError("No cameras found")
+    cam = cameras[0]
+    cam.__enter__()
+    try:
+        cam.TriggerMode.set('Off')
+    except Exception as e:
+        print(f"Could not disable triggering: {e}")
+    frame = cam.get_frame(timeout_ms=5000)
+    bayer = np.ascontiguousarray(np.squeeze(frame.as_numpy_ndarray()))
+    return bayer, frame, (vmb, cam)
+
+
+def time_call(func, runs):
+    """Run func once to warm up, then runs times. Returns the timings in milliseconds."""
+    func()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def remosaic(image):
+    """Sample a 3-channel image back onto an RGGB Bayer plane in the pipeline's channel layout"""
+    bayer = np.empty(image.shape[:2], dtype=image.dtype)
+    bayer[0::2, 0::2] = image[0::2, 0::2, 2]
+    bayer[0::2, 1::2] = image[0::2, 1::2, 1]
+    bayer[1::2, 0::2] = image[1::2, 0::2, 1]
+    bayer[1::2, 1::2] = image[1::2, 1::2, 0]
+    return bayer
+
+
+def reference_image(bayer, tone_mapper):
+    """Interpolation-free half-resolution RGB built from the Bayer quads, used as ground truth"""
+    height, width = bayer.shape[0] // 2, bayer.shape[1] // 2
+    truth = np.empty((height, width, 3), dtype=np.uint8)
+    green = np.empty((height, width), dtype=np.uint16)
+    bin_bayer(bayer, truth, green, tone_mapper.table_for(bayer.dtype))
+    # Even dimensions so the truth can be sampled back onto whole quads
+    return np.ascontiguousarray(truth[:height & ~1, :width & ~1])
+
+
+def print_row(name, timings, quality):
+    quality_text = f"{quality:8.2f}" if quality is not None else "     n/a"
+    print(f"{name:<18}{np.mean(timings):10.2f}{np.min(timings):10.2f}{quality_text}")
+
+
+def benchmark_demosaic(args):
+    camera = None
+    frame = None
+    if args.camera:
+        bayer, frame, camera = grab_camera_frame()
+        if args.save:
+            np.save(args.save, bayer)
+            print(f"Saved raw frame to {args.save}")
+    elif args.frame:
+        bayer = load_bayer(args.frame)
+    else:
+        print("Give a recorded frame or --camera")
+        return 2
+
+    try:
+        tone_mapper = ToneMapper()
+        tone_mapper.configure(args.curve)
+        print(f"Frame {bayer.shape[1]}x{bayer.shape[0]} {bayer.dtype.name}, {args.runs} runs")
+
+        bayer8 = np.empty(bayer.shape, dtype=np.uint8)
+        tone_timings = time_call(lambda: tone_mapper.apply(bayer, bayer8), args.runs)
+        print(f"Tone mapping ({args.curve}): {np.mean(tone_timings):.2f} ms/frame\n")
+
+        # Quality: demosaic a Bayer plane sampled from a known RGB image and compare against it
+        truth = reference_image(bayer, tone_mapper)
+        mosaic = remosaic(truth)
+        border = 4
+        print(f"{'backend':<18}{'mean ms':>10}{'min ms':>10}{'PSNR dB':>8}")
+        rgb = np.empty(bayer.shape + (3,), dtype=np.uint8)
+        for backend in OPENCV_BACKENDS:
+            timings = time_call(lambda: demosaic_bayer8(bayer8, rgb, backend), args.runs)
+            estimate = demosaic_bayer8(mosaic, np.empty(truth.shape, dtype=np.uint8), backend)
+            quality = cv2.PSNR(truth[border:-border, border:-border], estimate[border:-border, border:-border])
+            print_row(backend, timings, quality)
+
+        if frame is not None:
+            timings = time_call(lambda: vmbpy_demosaic(frame, rgb), args.runs)
+            print_row(VMBPY_BACKEND, timings, None)
+        else:
+            print(f"{VMBPY_BACKEND:<18}needs --camera (VmbPy only transforms live frames)")
+        print("\nPSNR is measured against an interpolation-free half-resolution image re-sampled onto the Bayer grid.")
+    finally:
+        if camera:
+            vmb, cam = camera
+            cam.__exit__(None, None, None)
+            vmb.__exit__(None, None, None)
+    return 0
+
+
+class BenchmarkSettings:
+    """Fixed app settings handed to pipeline components the way SettingsManager would"""
+    def __init__(self, app_settings):
+        self.app_settings = app_settings
+
+    def subscribe_app_settings(self, callback):
+        callback(self.app_settings)
+
+    def get_exif_settings(self):
+        return SettingsManager().get_exif_settings()
+
+
+class BenchmarkCamera:
+    """Camera feature values for the EXIF data of benchmark frames"""
+    def get_camera_settings(self):
+        return {"ExposureTime": 10000, "ExposureAuto": "Off", "LineSource": "Off", "BalanceWhiteAuto": "Off"}
+
+
+def synthetic_bayer(width=4112, height=3008):
+    """12-bit Bayer frame with smooth structure and sensor-like noise, so JPEG encoding does realistic work"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    scene = 1800 + 900 * np.sin(x / 90) * np.cos(y / 70)
+    noise = np.random.default_rng(0).normal(0, 40, (height, width))
+    return np.clip(scene + noise, 0, 4095).astype(np.uint16)
+
+
+def run_jitter(args):
+    """Measure trigger-loop lateness while one saver mode writes frames"""
+    bayer = load_bayer(args.frame) if args.frame else synthetic_bayer()
+    folder = tempfile.mkdtemp(prefix="avt-jitter-")
+    settings = BenchmarkSettings({'saver_mode': args.mode, 'saver_workers': args.workers, 'exif_telemetry': False})
+    frame_save_queue = FrameSaveQueue()
+    pipeline = FramePipeline(frame_save_queue, settings)
+    service = type("BenchmarkService", (), {"current_recording_folder": folder})()
+    saver = FrameSaverPool(frame_save_queue, pipeline, service, ExifManager(settings, BenchmarkCamera()), settings)
+    # Fork saver processes before any other thread exists, as main.py does
+    saver.start()
+    pipeline.configure(bayer.shape[1], bayer.shape[0], bayer.dtype)
+    pipeline.start()
+
+    running = threading.Event()
+    running.set()
+    submitted = [0]
+
+    def camera():
+        interval = 1.0 / args.rate
+        next_frame = time.perf_counter()
+        while running.is_set():
+            pipeline.submit(bayer, datetime.now().astimezone(), submitted[0], None, True)
+            submitted[0] += 1
+            next_frame += interval
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    camera_thread = threading.Thread(target=camera, daemon=True)
+    camera_thread.start()
+
+    # The scheduler CameraHardwareController triggers with, at a short interval so there are many samples
+    scheduler = TriggerScheduler()
+    scheduler.configure(0.01)
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end:
+        deadline = scheduler.wait()
+        scheduler.record_trigger(deadline)
+    running.clear()
+    camera_thread.join()
+
+    drain_deadline = time.monotonic() + 60
+    while saver.next_commit < submitted[0] - pipeline.drop_stats.snapshot()["dropped"] and time.monotonic() < drain_deadline:
+        time.sleep(0.1)
+    saved = len([name for name in os.listdir(folder) if name.endswith('.jpg')])
+    shutil.rmtree(folder, ignore_errors=True)
+
+    stages = saver.get_stats()["stages"]
+    print(f"\n{args.mode}: {args.workers} workers, {args.rate} fps for {args.seconds} s")
+    lateness = scheduler.get_stats()
+    print(f"  trigger lateness mean {lateness['mean_ms']:.2f} ms, p50 {lateness['p50_ms']:.2f} ms, "
+          f"p99 {lateness['p99_ms']:.2f} ms, max {lateness['max_ms']:.2f} ms")
+    print(f"  frames submitted {submitted[0]}, saved {saved}, dropped {pipeline.drop_stats.snapshot()['dropped']}")
+    print("  saver stages " + ", ".join(f"{name} {stage['avg_ms']:.1f} ms" for name, stage in stages.items()))
+    return 0
+
+
+def benchmark_jitter(args):
+    if args.mode != "both":
+        return run_jitter(args)
+    # Each mode gets a fresh interpreter so saver processes always fork from a quiet process
+    for mode in ("threads", "processes"):
+        command = [sys.executable, os.path.abspath(__file__), "jitter", "--mode", mode, "--workers", str(args.workers),
+                   "--rate", str(args.rate), "--seconds", str(args.seconds)]
+        if args.frame:
+            command += ["--frame", args.frame]
+        subprocess.run(command, check=False)
+    return 0
+
+
+def benchmark_dng(args):
+    bayer = load_bayer(args.frame) if args.frame else synthetic_bayer()
+    folder = tempfile.mkdtemp(prefix="avt-dng-", dir=args.out)
+    exif_manager = ExifManager(None, BenchmarkCamera())
+    dng_writer = DngWriter(exif_manager)
+    tone_mapper = ToneMapper()
+    bayer8 = np.empty(bayer.shape, dtype=np.uint8)
+    rgb = np.empty(bayer.shape + (3,), dtype=np.uint8)
+    jpeg_path = os.path.join(folder, "frame.jpg")
+    dng_path = os.path.join(folder, "frame.dng")
+
+    def save_jpeg():
+        tone_mapper.apply(bayer, bayer8)
+        _, jpeg = cv2.imencode('.jpg', demosaic_bayer8(bayer8, rgb, args.backend))
+        with open(jpeg_path, 'wb') as f:
+            f.write(exif_manager.build_jpeg_with_exif(jpeg, datetime.now()))
+            os.fsync(f.fileno())
+
+    def save_dng():
+        dng_writer.write(dng_path, bayer, datetime.now())
+        # Count the time to reach the disk, not just the page cache
+        fd = os.open(dng_path, os.O_RDONLY)
+        os.fsync(fd)
+        os.close(fd)
+
+    try:
+        print(f"Frame {bayer.shape[1]}x{bayer.shape[0]} {bayer.dtype.name}, {args.runs} runs, writing to {folder}")
+        budget = 1000.0 / args.rate
+        print(f"{'format':<8}{'mean ms':>10}{'max ms':>10}{'MB':>8}{'budget':>9}")
+        for name, func, path in (("jpeg", save_jpeg, jpeg_path), ("dng", save_dng, dng_path)):
+            timings = time_call(func, args.runs)
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(f"{name:<8}{np.mean(timings):10.2f}{np.max(timings):10.2f}{size:8.1f}{np.mean(timings) / budget:8.0%}")
+        print(f"\nBudget is {budget:.0f} ms per frame at {args.rate} fps.")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return 0
+
+
+def benchmark_formats(args):
+    bayer12 = load_bayer(args.frame) if args.frame else synthetic_bayer()
+    if bayer12.dtype != np.uint16:
+        print("formats needs a 12-bit frame")
+        return 2
+    bayer8 = (bayer12 >> 4).astype(np.uint8)
+    packed = pack12(bayer12)
+    # Usable share of the link once GVSP packet headers are paid for
+    link_bytes_per_second = args.link_mbps * 1e6 / 8 * 0.95
+    formats = (
+        ("BayerRG8", bayer8, lambda slot: np.copyto(slot, bayer8)),
+        ("BayerRG12", bayer12, lambda slot: np.copyto(slot, bayer12)),
+        ("BayerRG12p", bayer12, lambda slot: unpack12(packed, bayer12.shape, slot))
+    )
+    payloads = {"BayerRG8": bayer8.nbytes, "BayerRG12": bayer12.nbytes, "BayerRG12p": packed.nbytes}
+
+    tone_mapper = ToneMapper()
+    tone8 = np.empty(bayer12.shape, dtype=np.uint8)
+    rgb = np.empty(bayer12.shape + (3,), dtype=np.uint8)
+    print(f"Frame {bayer12.shape[1]}x{bayer12.shape[0]}, {args.runs} runs, {args.link_mbps:.0f} Mbit/s link, "
+          f"{args.workers} saver workers")
+    print(f"{'format':<12}{'MB':>7}{'link fps':>10}{'callback ms':>13}{'save ms':>9}{'max fps':>9}")
+    for name, bayer, receive in formats:
+        slot = np.empty(bayer.shape, dtype=bayer.dtype)
+        callback_ms = np.mean(time_call(lambda: receive(slot), args.runs))
+
+        def save():
+            tone_mapper.apply(slot, tone8)
+            cv2.imencode('.jpg', demosaic_bayer8(tone8, rgb, "opencv_bilinear"))
+        save_ms = np.mean(time_call(save, args.runs))
+
+        link_fps = link_bytes_per_second / payloads[name]
+        max_fps = min(link_fps, 1000 / callback_ms, args.workers * 1000 / save_ms)
+        print(f"{name:<12}{payloads[name] / (1024 * 1024):7.1f}{link_fps:10.1f}{callback_ms:13.2f}{save_ms:9.1f}"
+              f"{max_fps:9.1f}")
+    print("\nmax fps is the lowest of the link rate, the callback rate and the saver workers' JPEG rate.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera pipeline benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    demosaic = commands.add_parser("demosaic", help="Compare demosaic backends on a recorded Bayer frame")
+    demosaic.add_argument("frame", nargs="?", help="Recorded raw Bayer frame (.npy, 16-bit PNG or TIFF)")
+    demosaic.add_argument("--camera", action="store_true", help="Grab the frame from the first camera")
+    demosaic.add_argument("--save", help="Save the grabbed camera frame as .npy for later runs")
+    demosaic.add_argument("--runs", type=int, default=10)
+    demosaic.add_argument("--curve", choices=TONE_CURVES, default="linear")
+    demosaic.set_defaults(func=benchmark_demosaic)
+
+    jitter = commands.add_parser("jitter", help="Trigger loop jitter while saving with saver threads or processes")
+    jitter.add_argument("--mode", choices=("threads", "processes", "both"), default="both")
+    jitter.add_argument("--workers", type=int, default=2)
+    jitter.add_argument("--rate", type=float, default=3.0, help="Frames saved per second")
+    jitter.add_argument("--seconds", type=float, default=10.0)
+    jitter.add_argument("--frame", help="Recorded raw Bayer frame to save instead of a synthetic one")
+    jitter.set_defaults(func=benchmark_jitter)
+
+    dng = commands.add_parser("dng", help="Time DNG writing against the JPEG save path")
+    dng.add_argument("frame", nargs="?", help="Recorded raw Bayer frame to save instead of a synthetic one")
+    dng.add_argument("--runs", type=int, default=10)
+    dng.add_argument("--rate", type=float, default=2.0, help="Recording frame rate the save must keep up with")
+    dng.add_argument("--backend", choices=OPENCV_BACKENDS, default="opencv_bilinear")
+    dng.add_argument("--out", help="Folder to write the test files in (defaults to the temporary directory)")
+    dng.set_defaults(func=benchmark_dng)
+
+    formats = commands.add_parser("formats", help="Achievable trigger rate for each camera pixel format")
+    formats.add_argument("frame", nargs="?", help="Recorded 12-bit raw Bayer frame instead of a synthetic one")
+    formats.add_argument("--runs", type=int, default=10)
+    formats.add_argument("--workers", type=int, default=2, help="Saver workers sharing the JPEG encoding")
+    formats.add_argument("--link-mbps", type=float, default=1000.0, help="Camera link speed in Mbit/s")
+    formats.set_defaults(func=benchmark_formats)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def packed12_size(pixel_count):
+    """Bytes needed for pixel_count 12-bit pixels packed two to three bytes"""
+    return (pixel_count * 3 + 1) // 2
+
+
+def _words(packed, offset, count):
+    """Unaligned little-endian 16-bit view of bytes offset, offset+1 of every 3-byte group"""
+    return np.ndarray((count,), dtype='<u2', buffer=packed, offset=offset, strides=(3,))
+
+
+def pack12(bayer, out=None):
+    """Pack 12-bit pixels two to three bytes, in the LSB-first layout of the GenICam BayerRG12p format.
+
+    Byte 0 holds the low 8 bits of the first pixel, byte 1 its high 4 bits in
+    the low nibble and the low 4 bits of the second pixel in the high nibble,
+    and byte 2 the high 8 bits of the second pixel. bayer must have an even
+    number of pixels.
+    """
+    pairs = bayer.reshape(-1, 2)
+    if out is None:
+        out = np.empty(pairs.shape[0] * 3, dtype=np.uint8)
+    # Bytes 0-1 of each group are the first pixel and bytes 1-2 the second shifted up a nibble
+    first = _words(out, 0, pairs.shape[0])
+    second = _words(out, 1, pairs.shape[0])
+    np.bitwise_and(pairs[:, 0], 0xFFF, out=first)
+    shared_nibble = second & 0xF
+    np.left_shift(pairs[:, 1], 4, out=second)
+    np.bitwise_or(second, shared_nibble, out=second)
+    return out
+
+
+def unpack12(packed, shape, out=None):
+    """Unpack BayerRG12p-layout bytes into a uint16 array of the given shape"""
+    if out is None:
+        out = np.empty(shape, dtype=np.uint16)
+    pairs = out.reshape(-1, 2)
+    packed = np.frombuffer(packed, dtype=np.uint8, count=packed12_size(int(np.prod(shape))))
+    np.bitwise_and(_words(packed, 0, pairs.shape[0]), 0xFFF, out=pairs[:, 0])
+    np.right_shift(_words(packed, 1, pairs.shape[0]), 4, out=pairs[:, 1])
+    return out
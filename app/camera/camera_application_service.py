@@ -4,7 +4,6 @@ from settings_manager import SettingsManager
 from vmbpy import EnumEntry
 import os
 import json
-import time
 
 class CameraApplicationService:
     def __init__(self, state_machine, camera_hardware_controller, socketio=None):
@@ -25,16 +24,19 @@ class CameraApplicationService:
 
         if new_state == CameraState.WRITE and current_state != CameraState.WRITE:
             self.set_recording_folder(folder_name)
+            self.camera_hardware_controller.pipeline.begin_transect(self.current_recording_folder)
+            if self.camera_hardware_controller.mavlink_handler:
+                self.camera_hardware_controller.mavlink_handler.distance_trigger.begin_transect(self.current_recording_folder)
             self.camera_hardware_controller.frame_index = 0
-            self.camera_hardware_controller.start_time = time.time()
 
         if new_state == CameraState.PREVIEW and current_state != CameraState.PREVIEW:
             self.camera_hardware_controller.frame_index = 0
-            self.camera_hardware_controller.start_time = time.time()
 
         
     
         success = self.state_machine.toggle_state(new_state)
+        if current_state == CameraState.WRITE and self.state_machine.get_state() != CameraState.WRITE:
+            self.camera_hardware_controller.pipeline.end_transect()
         
         if self.socketio:
             self.socketio.emit('state_change', {'state': self.state_machine.get_state().name})
@@ -1,12 +1,80 @@
 import threading
 import time
-import cv2
 import functools
 from datetime import datetime
-from vmbpy import Camera, Stream, Frame, FrameStatus, VmbFeatureError, PixelFormat, VmbSystem
+from vmbpy import Camera, Stream, Frame, FrameStatus, VmbFeatureError, PixelFormat, VmbSystem, EnumEntry, AllocationMode
 from settings_manager import SettingsManager
 import numpy as np
 from state_machine import CameraState, TriggerMode
+from camera.frame_pipeline import FramePipeline, parse_resolution
+from camera.trigger_scheduler import TriggerScheduler
+
+
+PREVIEW_SENSOR_MODES = ("full", "binning", "decimation", "roi")
+PIXEL_FORMATS = {"BayerRG8": PixelFormat.BayerRG8, "BayerRG12": PixelFormat.BayerRG12,
+                 "BayerRG12p": PixelFormat.BayerRG12p}
+# (mode, factor, pixel format, ROI size) of a sensor readout; the full 12-bit one works on every camera
+FULL_SENSOR = ("full", 1, "BayerRG12", None)
+STREAM_ALLOCATION_MODES = ("AnnounceFrame", "AllocAndAnnounceFrame")
+
+
+class StreamBufferStats:
+    """Stream frame buffers held by the application: frames that entered the callback and are not yet requeued.
+
+    Only real buffers are counted, so a trigger the camera ignores or drops
+    does not leave a buffer counted as in use. Triggers and received frames
+    are counted separately.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset(0, None)
+
+    def reset(self, buffer_count, allocation_mode):
+        with self.lock:
+            self.buffer_count = buffer_count
+            self.allocation_mode = allocation_mode
+            self.triggered = 0
+            self.received = 0
+            self.held = 0
+            self.incomplete = 0
+            self.peak = 0
+            self.exhausted = 0
+
+    def record_trigger(self):
+        with self.lock:
+            self.triggered += 1
+
+    def record_received(self):
+        """A frame buffer has entered the callback"""
+        with self.lock:
+            self.received += 1
+            self.held += 1
+            self.peak = max(self.peak, self.held)
+            # Every buffer is in the application's hands, so the camera has none left to fill
+            if self.held >= self.buffer_count:
+                self.exhausted += 1
+
+    def record_requeued(self, complete):
+        """The callback has handed the buffer back to the stream"""
+        with self.lock:
+            self.held -= 1
+            if not complete:
+                self.incomplete += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "buffer_count": self.buffer_count,
+                "allocation_mode": self.allocation_mode,
+                "outstanding": self.held,
+                "free": self.buffer_count - self.held,
+                "peak": self.peak,
+                "exhausted": self.exhausted,
+                "triggered": self.triggered,
+                "received": self.received,
+                "incomplete": self.incomplete
+            }
+
 
 class CameraHardwareController:
     def __init__(self, state_machine, frame_save_queue, mavlink_handler):
@@ -14,28 +82,87 @@ class CameraHardwareController:
         self.frame_save_queue = frame_save_queue
         self.current_camera = None
         self.camera_lock = threading.Lock()
-        self.frame_buffer = None
-        self.frame_lock = threading.Lock()
         self.settings_manager = SettingsManager()
         self.mavlink_handler = mavlink_handler
+        self.pipeline = FramePipeline(frame_save_queue, self.settings_manager)
 
         self.frame_index = 0
-        self.start_time = None
         self.frame_trigger_time = None
         self.frame_trigger_time_lock = threading.Lock()
 
         self.time_interval = 1
         self.preview_interval = 0.5
+        self.scheduler = TriggerScheduler()
+        # Wake the trigger loop at once on state changes instead of polling
+        self.state_machine.add_listener(self.scheduler.wake)
+        if self.mavlink_handler:
+            self.mavlink_handler.distance_trigger.on_trigger_time = self._on_distance_trigger_time
 
         self.last_telemetry = None
 
+        # Last known value of every parameter in parameters.json, so readers never go over GigE
+        self.feature_cache = {}
+        self.feature_cache_lock = threading.Lock()
+        self.watched_features = []
+
+        # Sensor readouts for PREVIEW and WRITE, and the one currently applied. Only the camera thread reconfigures the camera.
+        self.preview_sensor = FULL_SENSOR
+        self.write_sensor = FULL_SENSOR
+        self.sensor_mode = None
+        self.unsupported_sensors = set()
+        self.full_resolution = False
+        # Full-sensor (width, height), known once a full readout has been applied
+        self.sensor_size = None
+
+        # (buffer count, allocation mode) wanted for start_streaming, and the one the stream was started with
+        self.stream_config = (5, "AnnounceFrame")
+        self.streaming_config = None
+        self.buffer_stats = StreamBufferStats()
+        self.settings_manager.subscribe_app_settings(self._on_app_settings_changed)
+
+    def _on_app_settings_changed(self, app_settings):
+        mode = app_settings.get('preview_sensor_mode', 'full')
+        if mode not in PREVIEW_SENSOR_MODES:
+            print(f"Invalid preview sensor mode: {mode}")
+            mode = "full"
+        pixel_format = app_settings.get('preview_pixel_format', 'BayerRG12')
+        if pixel_format not in PIXEL_FORMATS:
+            print(f"Invalid preview pixel format: {pixel_format}")
+            pixel_format = "BayerRG12"
+        factor = max(1, int(app_settings.get('preview_sensor_factor', 4)))
+        roi = parse_resolution(app_settings.get('preview_resolution', '1028x752')) if mode == "roi" else None
+        write_format = app_settings.get('pixel_format', 'BayerRG12')
+        if write_format not in PIXEL_FORMATS:
+            print(f"Invalid pixel format: {write_format}")
+            write_format = "BayerRG12"
+        # Picked up by the camera thread on its next pass
+        self.preview_sensor = (mode, factor, pixel_format, roi)
+        self.write_sensor = ("full", 1, write_format, None)
+
+        allocation_mode = app_settings.get('stream_allocation_mode', 'AnnounceFrame')
+        if allocation_mode not in STREAM_ALLOCATION_MODES:
+            print(f"Invalid stream allocation mode: {allocation_mode}")
+            allocation_mode = "AnnounceFrame"
+        self.stream_config = (max(1, int(app_settings.get('stream_buffer_count', 5))), allocation_mode)
+        self.scheduler.set_catch_up(app_settings.get('trigger_catch_up', 'skip'))
+        self.scheduler.wake()
+
     def set_time_interval(self, interval_seconds):
         self.time_interval = interval_seconds
         print(f"Time interval set to {interval_seconds} seconds")
+        self.scheduler.wake()
         
     def set_preview_interval(self, interval_seconds):
         self.preview_interval = interval_seconds
         print(f"Preview interval set to {interval_seconds} seconds")
+        self.scheduler.wake()
+
+    def set_save_queue_budget(self, megabytes):
+        budget_bytes = int(megabytes * 1024 * 1024)
+        if budget_bytes == self.frame_save_queue.budget_bytes:
+            return
+        self.frame_save_queue.set_budget(budget_bytes)
+        self.pipeline.resize_for_budget()
 
     def requires_camera(default_return=None):
         """Decorator that checks if a camera is available before executing a method"""
@@ -51,13 +178,17 @@ class CameraHardwareController:
         return decorator
 
     def setup_camera(self, cam):
+        self._watch_features(cam)
         self.load_saved_settings()
         cam.TriggerSource.set('Software')
         cam.TriggerSelector.set('FrameStart')
         cam.TriggerMode.set('On')
         cam.AcquisitionMode.set('Continuous')
 
-        cam.set_pixel_format(PixelFormat.BayerRG12)
+        # The camera keeps its last readout across sessions, which may be a reduced preview one
+        self.sensor_mode = self._apply_first_sensor_mode(cam, list(dict.fromkeys([self.write_sensor, FULL_SENSOR])))
+        self.full_resolution = True
+        self._configure_pipeline(cam)
                 
         try:
             stream = cam.get_streams()[0]
@@ -66,50 +197,166 @@ class CameraHardwareController:
                 pass
         except (AttributeError, VmbFeatureError) as e:
             print(f"An error occurred during stream setup or packet size adjustment: {e}")
+
+        # The readout and trigger setup above change features too, so take a full snapshot last
+        self.refresh_feature_cache()
     
-    def frame_handler(self, cam: Camera, stream: Stream, frame: Frame):
-        print(f"Frame received: Status={frame.get_status()}, FrameIndex={self.frame_index}")
-        if frame.get_status() == FrameStatus.Complete:
+    def _configure_pipeline(self, cam):
+        pixel_format = cam.get_pixel_format()
+        dtype = np.uint8 if pixel_format == PixelFormat.BayerRG8 else np.uint16
+        width, height = cam.Width.get(), cam.Height.get()
+        mode, factor = self.sensor_mode[0], self.sensor_mode[1]
+        if mode == "full":
+            self.sensor_size = (width, height)
+        # Binning and decimation offsets count reduced pixels
+        step = factor if mode in ("binning", "decimation") else 1
+        self.pipeline.set_readout(cam.OffsetX.get() * step, cam.OffsetY.get() * step, step, self.sensor_size)
+        self.pipeline.configure(width, height, dtype, save=self.full_resolution)
 
-            image = frame.as_numpy_ndarray()
-            image = cv2.cvtColor(image, cv2.COLOR_BayerRG2RGB)
-            
-            if image.dtype == np.uint16:
-                image = (image / 16).astype(np.uint8)
+    def _start_streaming(self, camera):
+        buffer_count, allocation_mode = self.stream_config
+        self.buffer_stats.reset(buffer_count, allocation_mode)
+        camera.start_streaming(self.frame_handler, buffer_count=buffer_count,
+                               allocation_mode=getattr(AllocationMode, allocation_mode))
+        self.streaming_config = self.stream_config
+
+    def _update_streaming(self, camera):
+        """Restart the stream with the readout the state calls for or with new buffer settings. Runs on the camera thread."""
+        state = self.state_machine.get_state()
+        if state == CameraState.PREVIEW:
+            candidates = [self.preview_sensor, self.write_sensor, FULL_SENSOR]
+            # ROI viewers and viewers of levels the reduced readout cannot fill get the full sensor instead
+            reduced_size = self._readout_size(self.preview_sensor)
+            if reduced_size != self.sensor_size and self.pipeline.needs_full_readout(reduced_size or (0, 0)):
+                candidates = candidates[1:]
+        elif state == CameraState.WRITE:
+            candidates = [self.write_sensor, FULL_SENSOR]
+        else:
+            return
+        # Readouts the camera rejected before are not retried on every pass of the trigger loop
+        candidates = [sensor for sensor in dict.fromkeys(candidates) if sensor not in self.unsupported_sensors] or [FULL_SENSOR]
+        change_readout = candidates[0] != self.sensor_mode
+        if not change_readout and self.stream_config == self.streaming_config:
+            return
 
-            app_settings = self.settings_manager.get_app_settings()
-            stream_resolution = app_settings.get('preview_resolution', '1028x752')
+        start = time.perf_counter()
+        # Size and format are locked while streaming; frames still in flight are flushed
+        camera.stop_streaming()
+        if change_readout:
+            self.full_resolution = False
+            self.sensor_mode = self._apply_first_sensor_mode(camera, candidates)
+            self.full_resolution = self.sensor_mode in (self.write_sensor, FULL_SENSOR)
+            self._configure_pipeline(camera)
+        self._start_streaming(camera)
+        print(f"Streaming {camera.Width.get()}x{camera.Height.get()} {camera.get_pixel_format()} ({self.sensor_mode[0]}) "
+              f"with {self.streaming_config[0]} {self.streaming_config[1]} buffers, "
+              f"restarted in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def _readout_size(self, sensor):
+        """Expected frame (width, height) of a readout, or None before the sensor size is known"""
+        if not self.sensor_size:
+            return None
+        mode, factor, _, roi = sensor
+        width, height = self.sensor_size
+        if mode in ("binning", "decimation"):
+            return width // factor, height // factor
+        if mode == "roi" and roi:
+            return min(roi[0], width), min(roi[1], height)
+        return width, height
 
+    def _apply_first_sensor_mode(self, camera, candidates):
+        """Apply the first readout the camera accepts, remembering the ones it rejects. Returns the one applied."""
+        for sensor in candidates[:-1]:
             try:
-                width, height = map(int, stream_resolution.split('x'))
-                # Only resize if the dimensions are different from the original
-                if width != image.shape[1] or height != image.shape[0]:
-                    image_stream = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
-                else:
-                    image_stream = image
-            except (ValueError, AttributeError):
-                print(f"Invalid resolution format: {stream_resolution}")
-                image_stream = image
-        
-            _, jpeg = cv2.imencode('.jpg', image_stream)
-            with self.frame_lock:
-                self.frame_buffer = jpeg.tobytes()
+                self._apply_sensor_mode(camera, sensor)
+                return sensor
+            except Exception as e:
+                print(f"Could not apply {sensor[0]} {sensor[2]} sensor readout, trying the next: {e}")
+                self.unsupported_sensors.add(sensor)
+        self._apply_sensor_mode(camera, candidates[-1])
+        return candidates[-1]
+
+    def _apply_sensor_mode(self, camera, sensor):
+        """Set binning or decimation, the ROI and the pixel format. Streaming must be stopped."""
+        mode, factor, pixel_format, roi = sensor
+        # Back to the whole sensor first, since the size limits depend on binning and decimation
+        for name in ("BinningHorizontal", "BinningVertical", "DecimationHorizontal", "DecimationVertical"):
+            if hasattr(camera, name):
+                camera.__getattribute__(name).set(1)
+        camera.OffsetX.set(0)
+        camera.OffsetY.set(0)
+        if mode in ("binning", "decimation") and factor > 1:
+            prefix = "Binning" if mode == "binning" else "Decimation"
+            camera.__getattribute__(prefix + "Horizontal").set(factor)
+            camera.__getattribute__(prefix + "Vertical").set(factor)
+        camera.Width.set(camera.Width.get_range()[1])
+        camera.Height.set(camera.Height.get_range()[1])
+        if mode == "roi" and roi:
+            self._set_centred_roi(camera, *roi)
+        camera.set_pixel_format(PIXEL_FORMATS[pixel_format])
+        # Colour models may only bin into a mono format, which the pipeline cannot demosaic
+        if camera.get_pixel_format() != PIXEL_FORMATS[pixel_format]:
+            raise ValueError(f"camera delivers {camera.get_pixel_format()} instead of {pixel_format}")
+
+    def _set_centred_roi(self, camera, width, height):
+        full_width, full_height = camera.Width.get(), camera.Height.get()
+        width = self._align(camera.Width, min(width, full_width))
+        height = self._align(camera.Height, min(height, full_height))
+        camera.Width.set(width)
+        camera.Height.set(height)
+        camera.OffsetX.set(self._align(camera.OffsetX, (full_width - width) // 2))
+        camera.OffsetY.set(self._align(camera.OffsetY, (full_height - height) // 2))
+
+    @staticmethod
+    def _align(feature, value):
+        """Round value down to the feature's increment, in whole Bayer quads so the pattern stays RGGB"""
+        step = feature.get_increment()
+        if step % 2:
+            step *= 2
+        return max(value // step * step, feature.get_range()[0])
+
+    def frame_handler(self, cam: Camera, stream: Stream, frame: Frame):
+        print(f"Frame received: Status={frame.get_status()}, FrameIndex={self.frame_index}")
+        start = time.perf_counter()
+        self.buffer_stats.record_received()
+        complete = frame.get_status() == FrameStatus.Complete
+        try:
+            self._handle_frame(frame, complete)
+        finally:
+            cam.queue_frame(frame)
+            self.buffer_stats.record_requeued(complete)
+        self.pipeline.metrics["capture"].record(time.perf_counter() - start)
 
+    def _handle_frame(self, frame, complete):
+        if complete:
             with self.frame_trigger_time_lock:
                 trigger_time = self.frame_trigger_time
-            
-            if self.state_machine.should_save() and not self.frame_save_queue.full():
-                print(f"Frame {self.frame_index} processed successfully")
-                self.frame_save_queue.put((image.copy(), trigger_time, self.frame_index, self.last_telemetry))
-                        
-        
-        cam.queue_frame(frame)
+
+            # Keep the callback short: copy the raw Bayer data into a pooled slot and let the pipeline do the rest
+            # A reduced preview frame that arrives just after the switch to WRITE is not saved
+            save = self.full_resolution and self.state_machine.should_save()
+            if frame.get_pixel_format() == PixelFormat.BayerRG12p:
+                # VmbPy has no NumPy view of packed formats; the pipeline unpacks the bytes into its slot
+                source = np.frombuffer(frame.get_buffer(), dtype=np.uint8)
+            else:
+                source = frame.as_numpy_ndarray()
+            self.pipeline.submit(source, trigger_time, self.frame_index, self.last_telemetry,
+                                 save, frame)
     
     def get_latest_frame(self):
-        with self.frame_lock:
-            return self.frame_buffer
+        return self.pipeline.get_latest_frame()
+
+    def get_stream_stats(self):
+        return self.buffer_stats.snapshot()
+
+    def get_trigger_stats(self):
+        stats = self.scheduler.get_stats()
+        if self.mavlink_handler:
+            stats["distance"] = self.mavlink_handler.distance_trigger.get_stats()
+        return stats
     
     def start_camera_thread(self):
+        self.pipeline.start()
         thread = threading.Thread(target=self._camera_thread, daemon=True)
         thread.start()
         return thread
@@ -165,74 +412,124 @@ class CameraHardwareController:
                     self.current_camera = camera
 
                 self.setup_camera(camera)
-                camera.start_streaming(self.frame_handler)
+                self._start_streaming(camera)
                 self.state_machine.set_camera_available(True)
                 self._process_frames(camera) 
             finally:
                 camera.stop_streaming()
+                self._unwatch_features()
+                with self.feature_cache_lock:
+                    self.feature_cache = {}
+                self.sensor_mode = None
+                self.sensor_size = None
+                self.streaming_config = None
+                self.full_resolution = False
                 with self.camera_lock:
                     self.current_camera = None
 
-    def interval_met(self, target_interval):
-        current_time = time.time()
-        trigger_time = self.frame_index * target_interval + self.start_time
-        if current_time >= trigger_time:
-            return True
-        return False
-
-    def trigger_frame(self, camera):
+    def trigger_frame(self, camera, deadline=None):
+        """Fire a software trigger. deadline is the scheduler deadline it answers, if any, for the jitter statistics."""
         with self.frame_trigger_time_lock:
             self.frame_trigger_time = datetime.now()
         self.frame_index += 1
         self.last_telemetry = self.mavlink_handler.get_telemetry()
         print(f"Triggering frame {self.frame_index}")   
+        self.buffer_stats.record_trigger()
         camera.TriggerSoftware.run()
+        if deadline is not None:
+            self.scheduler.record_trigger(deadline)
+
+    def _trigger_schedule(self):
+        """What should trigger frames in the current state: ("preview" or "time", interval), ("distance", None) or None"""
+        state = self.state_machine.get_state()
+        if state == CameraState.PREVIEW:
+            return ("preview", self.preview_interval)
+        if state == CameraState.WRITE:
+            if self.state_machine.trigger_mode == TriggerMode.DISTANCE:
+                return ("distance", None)
+            return ("time", self.time_interval)
+        return None
+
+    def _on_distance_trigger_time(self, when):
+        # Predictions arrive with every position fix; only act on them while recording by distance
+        if self._trigger_schedule() == ("distance", None):
+            self.scheduler.trigger_at(when)
 
     def _process_frames(self, camera):
-        previous_time = time.time()
+        schedule = None
         while True:
             if self.state_machine.should_stream():
-                if self.state_machine.get_state() == CameraState.PREVIEW:
-                    current_time = time.time()
-                    if current_time - previous_time >= self.preview_interval:
-                        print("TRIGGERING PREVIEW")
-                        self.trigger_frame(camera)
-                        previous_time = current_time
-                        
-                elif self.state_machine.get_state() == CameraState.WRITE:
-                    if self.state_machine.trigger_mode == TriggerMode.TIME:
-                        current_time = time.time()
-                        if current_time - previous_time >= self.time_interval:
-                            print("TRIGGERING TIME")
-                            self.trigger_frame(camera)
-                            previous_time = current_time
-                    elif self.state_machine.trigger_mode == TriggerMode.DISTANCE:
-                        if self.mavlink_handler and self.mavlink_handler.should_trigger_photo_by_distance():
-                            print("TRIGGERING DISTANCE")
-                            self.trigger_frame(camera)
-                            self.mavlink_handler.reset_distance_tracking()
-
-            time.sleep(0.01)
+                self._update_streaming(camera)
+            wanted = self._trigger_schedule()
+            if wanted != schedule:
+                schedule = wanted
+                self.scheduler.configure(schedule[1] if schedule else None)
+
+            # Sleeps until the next deadline or a wake-up; the timeout only guards against a missed wake-up
+            deadline = self.scheduler.wait(timeout=1.0)
+            if self._trigger_schedule() != schedule:
+                continue
+            if deadline is not None:
+                print(f"TRIGGERING {schedule[0].upper()}")
+                self.trigger_frame(camera, deadline)
+                if schedule[0] == "distance":
+                    self.mavlink_handler.distance_trigger.record_photo(self.frame_index)
     
     def get_camera(self):
         with self.camera_lock:
             return self.current_camera
         
+    def get_camera_settings(self):
+        """Snapshot of the cached camera feature values"""
+        with self.feature_cache_lock:
+            return dict(self.feature_cache)
+
+    def _cache_feature_value(self, param_id, value):
+        if isinstance(value, EnumEntry):
+            value = str(value)
+        with self.feature_cache_lock:
+            self.feature_cache[param_id] = value
+
+    def _read_feature(self, camera, param_id):
+        try:
+            self._cache_feature_value(param_id, camera.__getattribute__(param_id).get())
+        except Exception as e:
+            print(f"Error retrieving setting {param_id}: {e}")
+
     @requires_camera(default_return={})
-    def get_camera_settings(self, camera):
-        settings = {}
-        parameters_info = self.settings_manager.get_parameters_definitions()
-        
-        for param in parameters_info["parameters"]:
-            param_id = param["id"]
+    def refresh_feature_cache(self, camera):
+        """Re-read every known parameter from the camera into the cache"""
+        for param_id in self.settings_manager.get_parameter_registry().ids():
             if hasattr(camera, param_id):
-                try:
-                    value = camera.__getattribute__(param_id).get()
-                    settings[param_id] = value
-                except Exception as e:
-                    print(f"Error retrieving setting {param_id}: {e}")
-        
-        return settings
+                self._read_feature(camera, param_id)
+        return self.get_camera_settings()
+
+    def _on_feature_changed(self, feature):
+        # Called by VmbPy when the camera changes a value itself, e.g. with ExposureAuto=Continuous
+        try:
+            self._cache_feature_value(feature.get_name(), feature.get())
+        except Exception as e:
+            print(f"Error updating cached feature {feature.get_name()}: {e}")
+
+    def _watch_features(self, camera):
+        self._unwatch_features()
+        for param_id in self.settings_manager.get_parameter_registry().ids():
+            if not hasattr(camera, param_id):
+                continue
+            try:
+                feature = camera.__getattribute__(param_id)
+                feature.register_change_handler(self._on_feature_changed)
+                self.watched_features.append(feature)
+            except Exception as e:
+                print(f"Could not watch feature {param_id}: {e}")
+
+    def _unwatch_features(self):
+        for feature in self.watched_features:
+            try:
+                feature.unregister_change_handler(self._on_feature_changed)
+            except Exception as e:
+                print(f"Could not stop watching feature {feature.get_name()}: {e}")
+        self.watched_features = []
 
     def _apply_parameter(self, camera, param_id, value, param_type=None):
         try:
@@ -246,34 +543,30 @@ class CameraHardwareController:
             print(f"Error applying parameter {param_id}: {e}")
             return False
 
-    def _get_parameter_types(self):
-        """Get a dictionary mapping parameter IDs to their types"""
-        parameters_info = self.settings_manager.get_parameters_definitions()
-        return {param["id"]: param["type"] for param in parameters_info["parameters"]}
-
     @requires_camera(default_return=False)
     def apply_specific_settings(self, camera, settings):
-        param_types = self._get_parameter_types()
+        registry = self.settings_manager.get_parameter_registry()
         
         success = True
         for param_id, value in settings.items():
             if hasattr(camera, param_id):
-                if not self._apply_parameter(camera, param_id, value, param_types.get(param_id)):
+                if not self._apply_parameter(camera, param_id, value, registry.get_type(param_id)):
                     success = False
+                # Read back, the camera may have adjusted the value to its increment or limits
+                self._read_feature(camera, param_id)
         
         return success
 
     @requires_camera(default_return=False)
     def load_saved_settings(self, camera):             
-        parameters_info = self.settings_manager.get_parameters_definitions()
-        param_types = self._get_parameter_types()
+        registry = self.settings_manager.get_parameter_registry()
         
-        for param in parameters_info["parameters"]:
-            param_id = param["id"]
-            value = param.get("value", param.get("default"))
+        for param_id in registry.ids():
+            value = registry.saved_value(param_id)
             
             if hasattr(camera, param_id):
-                self._apply_parameter(camera, param_id, value, param_types.get(param_id))
+                self._apply_parameter(camera, param_id, value, registry.get_type(param_id))
+                self._read_feature(camera, param_id)
         
         return True
             
@@ -0,0 +1,31 @@
+import cv2
+
+
+# OpenCV names Bayer patterns from the second row and column, so BayerRG here
+# reads an RGGB sensor into the BGR order cv2.imencode expects
+OPENCV_BACKENDS = {
+    "opencv_bilinear": cv2.COLOR_BayerRG2RGB,
+    "opencv_ea": cv2.COLOR_BayerRG2RGB_EA,
+    "opencv_vng": cv2.COLOR_BayerRG2RGB_VNG,
+}
+VMBPY_BACKEND = "vmbpy"
+DEMOSAIC_BACKENDS = tuple(OPENCV_BACKENDS) + (VMBPY_BACKEND,)
+DEFAULT_BACKEND = "opencv_bilinear"
+
+
+def demosaic_bayer8(bayer8, dst, backend=DEFAULT_BACKEND):
+    """Demosaic an 8-bit Bayer plane into dst with one of the OpenCV algorithms.
+
+    The VmbPy backend needs the live camera frame, so arrays asked to use it
+    fall back to bilinear.
+    """
+    cv2.cvtColor(bayer8, OPENCV_BACKENDS.get(backend, OPENCV_BACKENDS[DEFAULT_BACKEND]), dst=dst)
+    return dst
+
+
+def vmbpy_demosaic(frame, dst):
+    """Convert a VmbPy Frame into the uint8 (height, width, 3) array dst with VmbPy's image transform"""
+    from vmbpy import PixelFormat
+    # Bgr8 matches the channel order produced by the OpenCV backends
+    frame.convert_pixel_format(PixelFormat.Bgr8, destination_buffer=dst.data)
+    return dst
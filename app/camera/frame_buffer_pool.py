@@ -0,0 +1,127 @@
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class PooledBuffer:
+    """A reusable array owned by a FrameBufferPool.
+
+    Every stage that keeps a reference calls retain() and must call release()
+    when it is done; the buffer returns to the pool once nothing holds it.
+    """
+    def __init__(self, pool, array, index=0):
+        self.pool = pool
+        self.array = array
+        self.index = index
+        self.refs = 0
+
+    def describe(self):
+        """Shared memory name, byte offset, shape and dtype locating this buffer for another process"""
+        return (self.pool.shared_memory.name, self.index * self.pool.slot_bytes, self.pool.shape, self.pool.dtype.str)
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    def retain(self):
+        self.pool._retain(self)
+        return self
+
+    def release(self):
+        self.pool._release(self)
+
+
+class FrameBufferPool:
+    """Fixed number of preallocated NumPy buffers of a single shape and dtype.
+
+    With shared=True the buffers are slots of one multiprocessing shared
+    memory block, so worker processes can map a frame from its describe()
+    tuple instead of receiving a copy. The block is unlinked once the pool has
+    been retired and every buffer is back.
+    """
+    def __init__(self, name, shape, dtype, count, shared=False):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self.slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.condition = threading.Condition()
+        self.shared_memory = None
+        self.retired = False
+        if shared:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=max(count * self.slot_bytes, 1))
+            self.buffers = [PooledBuffer(self, np.ndarray(self.shape, dtype=self.dtype, buffer=self.shared_memory.buf,
+                                                          offset=index * self.slot_bytes), index)
+                            for index in range(count)]
+        else:
+            self.buffers = [PooledBuffer(self, np.empty(self.shape, dtype=self.dtype), index) for index in range(count)]
+        self.free = deque(self.buffers)
+        self.misses = 0
+        self.acquired = 0
+
+    def matches(self, shape, dtype):
+        return self.shape == tuple(shape) and self.dtype == np.dtype(dtype)
+
+    def acquire(self, timeout=0):
+        """Take a buffer from the pool, waiting up to timeout seconds. Returns None if none is free."""
+        with self.condition:
+            if not self.free and timeout:
+                self.condition.wait_for(lambda: self.free, timeout=timeout)
+            if not self.free:
+                self.misses += 1
+                return None
+            buffer = self.free.popleft()
+            buffer.refs = 1
+            self.acquired += 1
+            return buffer
+
+    def _retain(self, buffer):
+        with self.condition:
+            buffer.refs += 1
+
+    def _release(self, buffer):
+        with self.condition:
+            buffer.refs -= 1
+            if buffer.refs <= 0:
+                buffer.refs = 0
+                self.free.append(buffer)
+                self.condition.notify()
+                if self.retired:
+                    self._unlink_if_idle()
+
+    def retire(self):
+        """Mark a replaced pool so its shared memory is freed once the last buffer comes back"""
+        with self.condition:
+            self.retired = True
+            self._unlink_if_idle()
+
+    def _unlink_if_idle(self):
+        if self.shared_memory is not None and len(self.free) == self.count:
+            try:
+                self.shared_memory.unlink()
+            except FileNotFoundError:
+                pass
+            self.shared_memory = None
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                "shape": list(self.shape),
+                "dtype": self.dtype.name,
+                "count": self.count,
+                "free": len(self.free),
+                "in_use": self.count - len(self.free),
+                "misses": self.misses,
+                "acquired": self.acquired,
+                "bytes": self.count * self.slot_bytes,
+                "shared": self.shared_memory is not None
+            }
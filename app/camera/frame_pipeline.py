@@ -0,0 +1,708 @@
+import os
+import threading
+import time
+from queue import Queue, Empty, Full
+import cv2
+import numpy as np
+from camera.bayer_packing import packed12_size, unpack12
+from camera.frame_buffer_pool import FrameBufferPool
+from camera.preview_broadcaster import PreviewBroadcaster
+from camera.tone_mapping import ToneMapper
+from camera.demosaic import DEMOSAIC_BACKENDS, DEFAULT_BACKEND, VMBPY_BACKEND, demosaic_bayer8, vmbpy_demosaic
+from frame_save_queue import SpilledFrame, FrameDropStats
+
+
+class StageMetrics:
+    """Counters and timings for a single pipeline stage"""
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed):
+        with self.lock:
+            self.processed += 1
+            self.total_time += elapsed
+            self.last_time = elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def record_drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def snapshot(self, queue_depth=None):
+        with self.lock:
+            average = self.total_time / self.processed if self.processed else 0.0
+            result = {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "avg_ms": round(average * 1000, 2),
+                "last_ms": round(self.last_time * 1000, 2),
+                "max_ms": round(self.max_time * 1000, 2)
+            }
+        if queue_depth is not None:
+            result["queue_depth"] = queue_depth
+        return result
+
+
+class CapturedFrame:
+    """Pooled raw Bayer buffer and metadata handed from the frame callback to the pipeline"""
+    def __init__(self, raw, trigger_time, frame_index, telemetry, readout=(0, 0, 1)):
+        self.raw = raw
+        self.trigger_time = trigger_time
+        self.frame_index = frame_index
+        self.telemetry = telemetry
+        # (offset x, offset y, step) of the sensor readout the frame came from, in full-sensor pixels
+        self.readout = readout
+        self.image = None
+        self.converted = None
+        self.roi_images = {}
+
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block", "spill")
+
+
+def parse_resolution(text):
+    """Parse 'WIDTHxHEIGHT' into a (width, height) tuple, or None if it is not valid"""
+    try:
+        width, height = map(int, str(text).lower().split('x'))
+    except (ValueError, AttributeError):
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+
+def bin_bayer(bayer, dst, green, lut, step=1):
+    """Build reduced-resolution 8-bit RGB from 2x2 Bayer quads without interpolating.
+
+    Each quad becomes one pixel: the two green sites are averaged and red and
+    blue are taken as they are, then every plane goes through the tone lookup
+    table. step > 1 decimates further by only reading every step-th quad.
+    Channels are laid out like cv2.COLOR_BayerRG2RGB so binned and demosaiced
+    previews look the same. green is a uint16 scratch array of the output's
+    height and width.
+    """
+    stride = 2 * step
+    np.take(lut, bayer[0::stride, 0::stride], out=dst[:, :, 2], mode='clip')
+    np.take(lut, bayer[1::stride, 1::stride], out=dst[:, :, 0], mode='clip')
+    np.add(bayer[0::stride, 1::stride], bayer[1::stride, 0::stride], out=green, dtype=np.uint16)
+    np.right_shift(green, 1, out=green)
+    np.take(lut, green, out=dst[:, :, 1], mode='clip')
+    return dst
+
+
+class FramePipeline:
+    """Demosaic and preview-encode stages running on worker threads.
+
+    The camera callback only copies the raw Bayer buffer into a pooled slot.
+    Frames that must be saved go straight to the byte-budgeted save queue in
+    that compact Bayer form and are demosaiced by the saver; every frame is
+    also offered to the demosaic stage, which renders the preview. When no
+    viewer needs more than half the sensor resolution the preview is binned
+    straight from the Bayer quads instead of demosaiced, skipping quads when
+    the viewers need even less. Buffers are sized by configure() so the
+    steady-state memory footprint does not change from frame to frame.
+
+    When the save queue is full the overflow policy decides what happens:
+    drop the new frame, evict the oldest queued frame, block the callback for
+    up to block_timeout seconds, or spill the frame to a disk overflow area.
+    Every frame that is lost is counted in drop_stats for the current transect.
+    """
+    def __init__(self, frame_save_queue, settings_manager, queue_size=2, rgb_buffer_count=5):
+        self.frame_save_queue = frame_save_queue
+        self.settings_manager = settings_manager
+        self.queue_size = queue_size
+        self.rgb_buffer_count = rgb_buffer_count
+        self.raw_queue = Queue(maxsize=queue_size)
+        self.preview_queue = Queue(maxsize=1)
+        self.spill_queue = Queue(maxsize=2)
+
+        self.overflow_policy = "drop_newest"
+        self.block_timeout = 0.5
+        self.spill_dir = None
+        # Overflow areas of finished transects, removed once their last spilled frame is saved
+        self.retired_spill_dirs = set()
+        self.spill_dirs_lock = threading.Lock()
+        self.drop_stats = FrameDropStats()
+        self.on_drop = None
+
+        self.frame_geometry = None
+        self.save_geometry = True
+        # Full-sensor (width, height) and where the current readout sits on it, for ROIs in sensor coordinates
+        self.sensor_geometry = None
+        self.readout = (0, 0, 1)
+        self.raw_pool = None
+        # Raw slots live in shared memory when frames are saved by worker processes
+        self.shared_raw = False
+        self.rgb_pool = None
+        self.binned_pool = None
+        self.scratch = threading.local()
+        self.preview_buffers = {}
+
+        self.broadcaster = PreviewBroadcaster()
+        self.broadcaster.on_new_level = self._refresh_preview
+        self.last_preview = None
+        self.last_preview_lock = threading.Lock()
+
+        self.tone_mapper = ToneMapper()
+        self.preview_backend = DEFAULT_BACKEND
+        self.save_backend = DEFAULT_BACKEND
+
+        # Kept current by the settings store so the per-frame path never touches the filesystem
+        self.app_settings = {}
+        self.settings_manager.subscribe_app_settings(self._on_app_settings_changed)
+
+        self.metrics = {
+            "capture": StageMetrics("capture"),
+            "demosaic": StageMetrics("demosaic"),
+            "preview": StageMetrics("preview"),
+            "save": StageMetrics("save")
+        }
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        for target in (self._demosaic_worker, self._preview_worker, self._spill_worker):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def configure(self, width, height, dtype, save=True):
+        """Allocate the buffer pools for frames of the given size and raw dtype.
+
+        With save=False the frames are preview-only, so the raw pool is not
+        sized to fill the save queue budget.
+        """
+        geometry = (width, height, np.dtype(dtype))
+        if geometry == self.frame_geometry and save == self.save_geometry and self.raw_pool:
+            return
+        self.frame_geometry = geometry
+        self.save_geometry = save
+        self._allocate_pools()
+        print(f"Frame pipeline configured for {width}x{height} {np.dtype(dtype).name} {'frames' if save else 'preview frames'}")
+
+    def set_readout(self, offset_x, offset_y, step, sensor_geometry=None):
+        """Place the frames on the full sensor: frame pixel (x, y) is sensor pixel (offset_x + x * step, offset_y + y * step)"""
+        if sensor_geometry:
+            self.sensor_geometry = sensor_geometry
+        self.readout = (offset_x, offset_y, step)
+
+    def _on_app_settings_changed(self, app_settings):
+        self.app_settings = app_settings
+        self.tone_mapper.configure(
+            app_settings.get('tone_curve', 'linear'),
+            app_settings.get('tone_gamma', 2.2),
+            app_settings.get('tone_black_point', 0),
+            app_settings.get('tone_white_point', 4095)
+        )
+        self.preview_backend = self._backend_setting(app_settings, 'demosaic_backend_preview')
+        save_backend = self._backend_setting(app_settings, 'demosaic_backend_save')
+        if save_backend != self.save_backend:
+            self.save_backend = save_backend
+            print(f"Save demosaic backend set to {save_backend}")
+            # VmbPy-converted frames wait in the save queue as RGB, which needs a larger RGB pool
+            if self.frame_geometry:
+                self._allocate_pools()
+
+    @staticmethod
+    def _backend_setting(app_settings, key):
+        backend = app_settings.get(key, DEFAULT_BACKEND)
+        if backend not in DEMOSAIC_BACKENDS:
+            print(f"Invalid demosaic backend for {key}: {backend}")
+            return DEFAULT_BACKEND
+        return backend
+
+    def set_overflow_policy(self, policy, block_timeout=None):
+        if policy not in OVERFLOW_POLICIES:
+            print(f"Invalid overflow policy: {policy}")
+            return False
+        self.overflow_policy = policy
+        if block_timeout is not None:
+            self.block_timeout = float(block_timeout)
+        print(f"Save queue overflow policy set to {policy}")
+        return True
+
+    def begin_transect(self, folder):
+        """Reset the drop counters and point the spill area at a new recording folder"""
+        self.end_transect()
+        self.spill_dir = os.path.join(folder, ".overflow") if folder else None
+        self.drop_stats.reset(os.path.basename(folder) if folder else None)
+
+    def end_transect(self):
+        """Stop spilling into the current recording folder and remove its overflow area once it is empty"""
+        with self.spill_dirs_lock:
+            if self.spill_dir:
+                self.retired_spill_dirs.add(self.spill_dir)
+            self.spill_dir = None
+        self._remove_spill_dirs()
+
+    def _remove_spill_dirs(self):
+        with self.spill_dirs_lock:
+            for directory in list(self.retired_spill_dirs):
+                try:
+                    os.rmdir(directory)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # Spilled frames are still waiting to be saved; the last one to go tries again
+                    continue
+                self.retired_spill_dirs.discard(directory)
+
+    def _record_drop(self, frame_index, reason):
+        print(f"Frame {frame_index} not saved ({reason})")
+        self.metrics["save"].record_drop()
+        self.drop_stats.record_drop(frame_index, reason)
+        if self.on_drop:
+            try:
+                self.on_drop(self.drop_stats.snapshot())
+            except Exception as e:
+                print(f"Error reporting dropped frame: {e}")
+
+    def set_shared_raw(self, shared):
+        """Move the raw pool into or out of shared memory"""
+        if shared == self.shared_raw:
+            return
+        self.shared_raw = shared
+        if self.frame_geometry:
+            self._allocate_pools()
+
+    def resize_for_budget(self):
+        """Re-size the raw pool after the save queue memory budget changed"""
+        if self.frame_geometry:
+            self._allocate_pools()
+
+    def _allocate_pools(self):
+        width, height, dtype = self.frame_geometry
+        raw_shape = (height, width)
+        frame_bytes = width * height * dtype.itemsize
+        # Enough raw slots to fill the save queue budget plus the frames in flight to the preview
+        raw_count = self.queue_size + 2
+        if self.save_geometry:
+            raw_count += self.frame_save_queue.budget_bytes // frame_bytes
+        # Slots still referenced by in-flight frames stay valid until released
+        if self.raw_pool:
+            self.raw_pool.retire()
+        self.raw_pool = FrameBufferPool("raw", raw_shape, dtype, raw_count, shared=self.shared_raw)
+        if self.shared_raw and self.save_backend != VMBPY_BACKEND:
+            # Saver processes demosaic their own copies, so the RGB pool only serves the preview and is made on first use
+            self.rgb_pool = None
+        else:
+            rgb_count = self.rgb_buffer_count
+            if self.save_backend == VMBPY_BACKEND and self.save_geometry:
+                rgb_count += self.frame_save_queue.budget_bytes // (frame_bytes * 3 // dtype.itemsize)
+            self.rgb_pool = FrameBufferPool("rgb", (height, width, 3), np.uint8, rgb_count)
+        self.binned_pool = None
+        self.preview_buffers = {}
+
+    def submit(self, source, trigger_time, frame_index, telemetry, save, frame=None):
+        """Copy a raw frame into a pooled slot and queue it. Called from the VmbPy frame callback.
+
+        frame is the live VmbPy Frame, needed only by the VmbPy demosaic backend.
+        BayerRG12p frames are passed as their raw bytes and unpacked into the slot.
+        """
+        pool = self.raw_pool
+        packed = pool is not None and self._is_packed(source, pool)
+        if pool is None or not packed and (source.size != np.prod(pool.shape) or source.dtype != pool.dtype):
+            print(f"Frame {frame_index} does not match the configured buffer pool, dropping")
+            self.metrics["capture"].record_drop()
+            return False
+
+        slot = pool.acquire()
+        if slot is None:
+            print(f"No free raw buffer, dropping frame {frame_index}")
+            self.metrics["capture"].record_drop()
+            if save:
+                self._record_drop(frame_index, "no_buffer")
+            return False
+
+        if packed:
+            unpack12(source, pool.shape, slot.array)
+        else:
+            np.copyto(slot.array, source.reshape(pool.shape))
+        captured = CapturedFrame(slot, trigger_time, frame_index, telemetry, self.readout)
+        if frame is not None and VMBPY_BACKEND in (self.preview_backend, self.save_backend):
+            self._convert_with_vmbpy(captured, frame, save)
+
+        if save:
+            self._queue_for_save(captured)
+        if captured.converted is not None:
+            captured.converted.release()
+            captured.converted = None
+
+        try:
+            self.raw_queue.put_nowait(captured)
+        except Full:
+            slot.release()
+            if captured.image is not None:
+                captured.image.release()
+            self.metrics["demosaic"].record_drop()
+        return True
+
+    @staticmethod
+    def _is_packed(source, pool):
+        # The payload may carry padding after the packed pixels
+        return source.dtype == np.uint8 and pool.dtype == np.uint16 and source.size >= packed12_size(int(np.prod(pool.shape)))
+
+    def _convert_with_vmbpy(self, captured, frame, save):
+        """VmbPy can only transform a live Frame, so its backend runs here in the callback"""
+        # Raw recordings keep the Bayer data, so only JPEG saving converts here
+        if save and self.save_backend == VMBPY_BACKEND and self.app_settings.get('save_format', 'jpeg') == 'jpeg':
+            captured.converted = self._render_vmbpy(frame, captured.frame_index)
+        if self.preview_backend == VMBPY_BACKEND and self.broadcaster.has_viewers():
+            if captured.converted is not None:
+                captured.image = captured.converted.retain()
+            else:
+                captured.image = self._render_vmbpy(frame, captured.frame_index)
+
+    def _get_rgb_pool(self):
+        rgb_pool = self.rgb_pool
+        if rgb_pool is None and self.frame_geometry:
+            width, height = self.frame_geometry[0], self.frame_geometry[1]
+            rgb_pool = self.rgb_pool = FrameBufferPool("rgb", (height, width, 3), np.uint8, self.rgb_buffer_count)
+        return rgb_pool
+
+    def _render_vmbpy(self, frame, frame_index):
+        rgb = self._get_rgb_pool().acquire()
+        if rgb is None:
+            print(f"No RGB buffer available for VmbPy conversion of frame {frame_index}")
+            return None
+        try:
+            vmbpy_demosaic(frame, rgb.array)
+        except Exception as e:
+            print(f"Error converting frame {frame_index} with VmbPy: {e}")
+            rgb.release()
+            return None
+        return rgb
+
+    def _queue_for_save(self, captured):
+        # The saver releases its reference once the frame is on disk. Frames
+        # already converted by VmbPy are queued as RGB, everything else as Bayer.
+        raw = (captured.converted or captured.raw).retain()
+        item = (raw, captured.trigger_time, captured.frame_index, captured.telemetry)
+        if self.frame_save_queue.put(item, raw.nbytes):
+            return True
+
+        policy = self.overflow_policy
+        reason = "drop_newest"
+        if policy == "drop_oldest":
+            while True:
+                oldest = self.frame_save_queue.pop_oldest()
+                if oldest is None:
+                    break
+                oldest[0].release()
+                self._record_drop(oldest[2], "drop_oldest")
+                if self.frame_save_queue.put(item, raw.nbytes):
+                    return True
+        elif policy == "block":
+            if self.frame_save_queue.put(item, raw.nbytes, block=True, timeout=self.block_timeout):
+                return True
+            reason = "block_timeout"
+        elif policy == "spill":
+            spill_dir = self.spill_dir
+            if spill_dir:
+                # Queue the spilled frame now so it is saved in capture order, not after frames captured while it is written
+                spilled = SpilledFrame.reserve(spill_dir, captured.frame_index, raw.array)
+                spilled.on_release = self._remove_spill_dirs
+                spilled_item = (spilled, captured.trigger_time, captured.frame_index, captured.telemetry)
+                self.frame_save_queue.put(spilled_item, spilled.nbytes)
+                try:
+                    self.spill_queue.put_nowait((raw, spilled_item))
+                    return True
+                except Full:
+                    self.frame_save_queue.remove(spilled_item)
+                    reason = "spill_busy"
+            else:
+                reason = "spill_unavailable"
+
+        raw.release()
+        self._record_drop(captured.frame_index, reason)
+        return False
+
+    def _spill_worker(self):
+        while True:
+            raw, item = self.spill_queue.get()
+            spilled, frame_index = item[0], item[2]
+            try:
+                spilled.write(raw.array)
+            except Exception as e:
+                print(f"Error spilling frame {frame_index}: {e}")
+                self.frame_save_queue.remove(item)
+                self._record_drop(frame_index, "spill_failed")
+                continue
+            finally:
+                raw.release()
+            self.drop_stats.record_spill()
+            self.frame_save_queue.notify_ready()
+
+    def _get_scratch(self, name, shape, dtype):
+        """Per-thread working array reused across frames of the same shape"""
+        buffers = getattr(self.scratch, name, None)
+        if buffers is None or len(buffers) > 8:
+            buffers = {}
+            setattr(self.scratch, name, buffers)
+        array = buffers.get(shape)
+        if array is None:
+            array = buffers[shape] = np.empty(shape, dtype=dtype)
+        return array
+
+    def make_roi(self, x, y, width, height):
+        """Build an ROI level in full-sensor pixels, clamped to the sensor and aligned to whole Bayer quads"""
+        geometry = self.sensor_geometry or self.frame_geometry
+        if not geometry:
+            raise ValueError("Camera frame size is not known yet")
+        frame_width, frame_height = geometry[0], geometry[1]
+        x = min(max(int(x), 0), frame_width - 2) & ~1
+        y = min(max(int(y), 0), frame_height - 2) & ~1
+        width = min(max(int(width), 2), frame_width - x) & ~1
+        height = min(max(int(height), 2), frame_height - y) & ~1
+        return ("roi", x, y, width, height)
+
+    def _render_rois(self, bayer, rois, readout):
+        """Demosaic only the requested windows of the raw Bayer frame.
+
+        ROIs are in full-sensor pixels. On a reduced readout the window is
+        mapped onto the frame and scaled back up, so a viewer keeps getting
+        images of the same size and sensor region across readout changes.
+        """
+        offset_x, offset_y, step = readout
+        images = {}
+        for roi in rois:
+            _, x, y, width, height = roi
+            left = max(x - offset_x, 0) // step & ~1
+            top = max(y - offset_y, 0) // step & ~1
+            right = min((x + width - offset_x) // step, bayer.shape[1]) & ~1
+            bottom = min((y + height - offset_y) // step, bayer.shape[0]) & ~1
+            if right <= left or bottom <= top:
+                continue
+            crop = bayer[top:bottom, left:right]
+            image = self.demosaic(crop, np.empty((bottom - top, right - left, 3), dtype=np.uint8), self.preview_backend)
+            if image.shape[:2] != (height, width):
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+            images[roi] = image
+        return images
+
+    def needs_full_readout(self, size):
+        """Whether a viewer wants a crop or a scaled level larger than a reduced readout of (width, height)"""
+        if self.broadcaster.active_rois():
+            return True
+        default_resolution = parse_resolution(self.app_settings.get('preview_resolution', '1028x752'))
+        resolutions = self.broadcaster.active_resolutions(default_resolution or size)
+        return any(level[0] > size[0] or level[1] > size[1] for level in resolutions)
+
+    def _binning_step(self, shape):
+        """Largest quad stride whose binned image still covers every scaled preview level, or None"""
+        default_resolution = parse_resolution(self.app_settings.get('preview_resolution', '1028x752'))
+        resolutions = self.broadcaster.active_resolutions(default_resolution or (shape[1], shape[0]))
+        step = None
+        for candidate in (1, 2, 4):
+            width, height = shape[1] // (2 * candidate), shape[0] // (2 * candidate)
+            if not all(level[0] <= width and level[1] <= height for level in resolutions):
+                break
+            step = candidate
+        return step
+
+    def render_binned(self, raw, step=1, timeout=5.0):
+        """Bin a pooled raw buffer into a pooled reduced-resolution RGB buffer. The caller must release the result."""
+        height, width = raw.array.shape[0] // (2 * step), raw.array.shape[1] // (2 * step)
+        binned_pool = self.binned_pool
+        if binned_pool is None or not binned_pool.matches((height, width, 3), np.uint8):
+            binned_pool = self.binned_pool = FrameBufferPool("binned", (height, width, 3), np.uint8,
+                                                             self.rgb_buffer_count)
+        rgb = binned_pool.acquire(timeout=timeout)
+        if rgb is None:
+            return None
+        try:
+            stride = 2 * step
+            bayer = raw.array[:height * stride, :width * stride]
+            green = self._get_scratch("green", (height, width), np.uint16)
+            bin_bayer(bayer, rgb.array, green, self.tone_mapper.table_for(bayer.dtype), step)
+        except Exception:
+            rgb.release()
+            raise
+        return rgb
+
+    def demosaic(self, bayer, dst, backend=DEFAULT_BACKEND):
+        """Tone map a raw Bayer array to 8 bits and demosaic it into RGB written to dst"""
+        bayer8 = self._get_scratch("bayer8", bayer.shape, np.uint8)
+        scratch = None
+        if self.tone_mapper.needs_scratch(bayer.dtype):
+            scratch = self._get_scratch("bayer16", bayer.shape, np.uint16)
+        self.tone_mapper.apply(bayer, bayer8, scratch)
+        demosaic_bayer8(bayer8, dst, backend)
+        return dst
+
+    def render(self, raw, timeout=5.0, backend=None):
+        """Demosaic a pooled raw buffer into a pooled RGB buffer. The caller must release the result.
+
+        backend defaults to the save backend setting.
+        """
+        rgb_pool = self._get_rgb_pool()
+        if rgb_pool is None or not rgb_pool.matches(raw.array.shape + (3,), np.uint8):
+            rgb_pool = FrameBufferPool("rgb", raw.array.shape + (3,), np.uint8, 1)
+        rgb = rgb_pool.acquire(timeout=timeout)
+        if rgb is None:
+            return None
+        try:
+            self.demosaic(raw.array, rgb.array, backend or self.save_backend)
+        except Exception:
+            rgb.release()
+            raise
+        return rgb
+
+    def get_latest_frame(self):
+        return self.broadcaster.get_latest_frame()
+
+    def get_metrics(self):
+        depths = {
+            "capture": None,
+            "demosaic": self.raw_queue.qsize(),
+            "preview": self.preview_queue.qsize(),
+            "save": self.frame_save_queue.qsize()
+        }
+        metrics = {name: stage.snapshot(depths[name]) for name, stage in self.metrics.items()}
+        metrics["save_queue"] = self.frame_save_queue.get_status()
+        metrics["drops"] = self.drop_stats.snapshot()
+        metrics["pools"] = {pool.name: pool.get_stats() for pool in (self.raw_pool, self.rgb_pool, self.binned_pool) if pool}
+        return metrics
+
+    def _demosaic_worker(self):
+        while True:
+            captured = self.raw_queue.get()
+            start = time.perf_counter()
+            raw = captured.raw
+            try:
+                # Nobody is watching any level or ROI, so there is nothing to render
+                if not self.broadcaster.has_viewers():
+                    if captured.image is not None:
+                        captured.image.release()
+                    continue
+                rois = self.broadcaster.active_rois()
+                if rois:
+                    captured.roi_images = self._render_rois(raw.array, rois, captured.readout)
+                # Frames converted by VmbPy in the callback already have their preview image
+                if captured.image is None:
+                    # The saver demosaics its own copy, so the preview can always take the cheap path
+                    rgb = None
+                    step = self._binning_step(raw.array.shape)
+                    if step:
+                        rgb = self.render_binned(raw, step, timeout=1.0)
+                    if rgb is None:
+                        rgb = self.render(raw, timeout=1.0, backend=self.preview_backend)
+                    if rgb is None:
+                        print(f"No RGB buffer available for preview of frame {captured.frame_index}")
+                        self.metrics["demosaic"].record_drop()
+                        continue
+                    captured.image = rgb
+                self.metrics["demosaic"].record(time.perf_counter() - start)
+            except Exception as e:
+                print(f"Error demosaicing frame {captured.frame_index}: {e}")
+                self.metrics["demosaic"].record_error()
+                if captured.image is not None:
+                    captured.image.release()
+                continue
+            finally:
+                captured.raw = None
+                raw.release()
+
+            self._offer_preview(captured)
+
+    def _offer_preview(self, captured):
+        # Preview only cares about the newest frame, so replace whatever is waiting
+        try:
+            self.preview_queue.put_nowait(captured)
+            return
+        except Full:
+            pass
+        try:
+            stale = self.preview_queue.get_nowait()
+            stale.image.release()
+            self.metrics["preview"].record_drop()
+        except Empty:
+            pass
+        try:
+            self.preview_queue.put_nowait(captured)
+        except Full:
+            captured.image.release()
+            self.metrics["preview"].record_drop()
+
+    def _get_preview_buffer(self, width, height):
+        buffer = self.preview_buffers.get((width, height))
+        if buffer is None:
+            buffer = np.empty((height, width, 3), dtype=np.uint8)
+            self.preview_buffers[(width, height)] = buffer
+        return buffer
+
+    def _refresh_preview(self):
+        """Re-encode the last preview frame, e.g. for a viewer of a level that is not cached yet"""
+        with self.last_preview_lock:
+            last = self.last_preview
+            if last is None:
+                return
+            last.image.retain()
+        self._offer_preview(last)
+
+    def _keep_last_preview(self, captured):
+        with self.last_preview_lock:
+            previous, self.last_preview = self.last_preview, captured
+        # Each offer holds one reference; last_preview keeps exactly one
+        if previous is not None:
+            previous.image.release()
+
+    def _encode_levels(self, image, resolutions):
+        """Resize and encode each requested level once, each from the smallest larger level already built"""
+        source_size = (image.shape[1], image.shape[0])
+        built = []
+        frames = {}
+        for width, height in sorted(resolutions, key=lambda size: size[0] * size[1], reverse=True):
+            if (width, height) == source_size:
+                level = image
+            else:
+                source = image
+                for built_size, built_image in built:
+                    if built_size[0] >= width and built_size[1] >= height:
+                        source = built_image
+                level = cv2.resize(source, (width, height), dst=self._get_preview_buffer(width, height),
+                                   interpolation=cv2.INTER_AREA)
+            built.append(((width, height), level))
+            _, jpeg = cv2.imencode('.jpg', level)
+            frames[(width, height)] = jpeg.tobytes()
+        return frames
+
+    def _preview_worker(self):
+        while True:
+            captured = self.preview_queue.get()
+            start = time.perf_counter()
+            try:
+                image = captured.image.array
+                stream_resolution = self.app_settings.get('preview_resolution', '1028x752')
+                default_resolution = parse_resolution(stream_resolution)
+                if default_resolution is None:
+                    print(f"Invalid resolution format: {stream_resolution}")
+                    default_resolution = (image.shape[1], image.shape[0])
+
+                resolutions = self.broadcaster.active_resolutions(default_resolution)
+                frames = self._encode_levels(image, resolutions) if resolutions else {}
+                for roi, roi_image in captured.roi_images.items():
+                    _, jpeg = cv2.imencode('.jpg', roi_image)
+                    frames[roi] = jpeg.tobytes()
+                captured.roi_images = {}
+                if frames:
+                    self.broadcaster.publish(frames)
+                    self.metrics["preview"].record(time.perf_counter() - start)
+            except Exception as e:
+                print(f"Error encoding preview frame {captured.frame_index}: {e}")
+                self.metrics["preview"].record_error()
+            finally:
+                self._keep_last_preview(captured)
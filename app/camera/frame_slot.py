@@ -0,0 +1,16 @@
+import threading
+
+
+class FrameSlot:
+    """Holds the latest encoded frame of one preview level"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+
+    def publish(self, frame):
+        with self.lock:
+            self.frame = frame
+
+    def get(self):
+        with self.lock:
+            return self.frame
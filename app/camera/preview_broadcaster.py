@@ -0,0 +1,168 @@
+import itertools
+import threading
+import time
+from camera.frame_slot import FrameSlot
+
+
+class PreviewClient:
+    """One-frame mailbox for a single viewer.
+
+    A frame that has not been collected when the next one arrives is replaced
+    (latest frame wins), so a slow consumer only ever falls one frame behind
+    and never holds up the publisher or other viewers.
+    """
+    def __init__(self, client_id, max_fps=None, description="", resolution=None, roi=None):
+        self.client_id = client_id
+        self.max_fps = max_fps
+        # (width, height) of the preview level this client watches, None for the preview_resolution setting
+        self.resolution = resolution
+        # ("roi", x, y, width, height) for a full-resolution crop instead of a scaled level
+        self.roi = roi
+        self.description = description
+        self.condition = threading.Condition()
+        self.frame = None
+        self.pending = False
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+        self.connected_at = time.time()
+        self.last_delivery = None
+
+    def offer(self, frame):
+        with self.condition:
+            if self.pending:
+                self.dropped += 1
+            self.frame = frame
+            self.pending = True
+            self.condition.notify_all()
+
+    def next_frame(self, timeout=None):
+        """Wait for a frame not yet collected. Returns None on timeout or once closed."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.pending or self.closed, timeout=timeout):
+                return None
+            if self.closed:
+                return None
+            self.pending = False
+            self.delivered += 1
+            self.last_delivery = time.time()
+            return self.frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def get_stats(self):
+        now = time.time()
+        with self.condition:
+            return {
+                "id": self.client_id,
+                "description": self.description,
+                "max_fps": self.max_fps,
+                "resolution": f"{self.resolution[0]}x{self.resolution[1]}" if self.resolution else None,
+                "roi": list(self.roi[1:]) if self.roi else None,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "connected_seconds": round(now - self.connected_at, 1),
+                "last_delivery_age_seconds": round(now - self.last_delivery, 2) if self.last_delivery else None
+            }
+
+
+class PreviewBroadcaster:
+    """Publishes each encoded preview frame once to every subscribed viewer's mailbox.
+
+    Frames are published per level: a scaled (width, height) resolution or a
+    ("roi", x, y, width, height) crop. The latest frame of every level is
+    cached for new viewers and the pipeline asks active_resolutions() and
+    active_rois() which levels to produce, so nothing nobody watches is encoded.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.ids = itertools.count(1)
+        self.levels = {}
+        self.default_resolution = None
+        self.published = {}
+        self.on_new_level = None
+
+    def _resolve(self, resolution):
+        return resolution or self.default_resolution
+
+    def _level(self, client):
+        return client.roi or self._resolve(client.resolution)
+
+    def subscribe(self, max_fps=None, description="", resolution=None, roi=None):
+        client = PreviewClient(next(self.ids), max_fps, description, resolution, roi)
+        with self.lock:
+            self.clients[client.client_id] = client
+        # Start new viewers off with the last frame instead of a blank image
+        frame = self.get_latest_frame(roi or resolution)
+        if frame is not None:
+            client.offer(frame)
+        elif self.on_new_level and not roi:
+            self.on_new_level()
+        print(f"Preview client {client.client_id} connected ({description})")
+        return client
+
+    def unsubscribe(self, client):
+        client.close()
+        with self.lock:
+            removed = self.clients.pop(client.client_id, None)
+            # Crops are per viewer, so drop the cached frame once nobody watches it
+            if client.roi and not any(other.roi == client.roi for other in self.clients.values()):
+                self.levels.pop(client.roi, None)
+                self.published.pop(client.roi, None)
+        if removed:
+            print(f"Preview client {client.client_id} disconnected after {client.delivered} frames")
+
+    def active_resolutions(self, default_resolution):
+        """Resolutions with at least one subscriber; default_resolution stands in for clients that follow the setting"""
+        self.default_resolution = default_resolution
+        with self.lock:
+            return {self._resolve(client.resolution) for client in self.clients.values() if not client.roi}
+
+    def has_viewers(self):
+        with self.lock:
+            return bool(self.clients)
+
+    def active_rois(self):
+        with self.lock:
+            return {client.roi for client in self.clients.values() if client.roi}
+
+    def publish(self, frames):
+        """Publish a dict of {level: jpeg_bytes} encoded from the same camera frame"""
+        for resolution, frame in frames.items():
+            with self.lock:
+                slot = self.levels.get(resolution)
+                if slot is None:
+                    slot = self.levels[resolution] = FrameSlot()
+                self.published[resolution] = self.published.get(resolution, 0) + 1
+            slot.publish(frame)
+
+        with self.lock:
+            clients = list(self.clients.values())
+        for client in clients:
+            frame = frames.get(self._level(client))
+            if frame is not None:
+                client.offer(frame)
+
+    def get_latest_frame(self, level=None):
+        with self.lock:
+            slot = self.levels.get(self._resolve(level))
+        return slot.get() if slot else None
+
+    @staticmethod
+    def _describe(level):
+        if level[0] == "roi":
+            return "roi {}x{}+{}+{}".format(level[3], level[4], level[1], level[2])
+        return "{}x{}".format(*level)
+
+    def get_stats(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            published = {self._describe(level): count for level, count in self.published.items()}
+        return {
+            "published": published,
+            "clients": [client.get_stats() for client in clients]
+        }
@@ -0,0 +1,85 @@
+import threading
+import cv2
+import numpy as np
+
+
+TONE_CURVES = ("linear", "gamma")
+
+
+def clamp_points(black_point, white_point, levels=4096):
+    """Keep black and white points inside the raw range with white above black"""
+    black_point = min(max(int(black_point), 0), levels - 2)
+    white_point = min(max(int(white_point), black_point + 1), levels - 1)
+    return black_point, white_point
+
+
+def build_tone_lut(curve="linear", gamma=2.2, black_point=0, white_point=4095, bits=12):
+    """Build a 2**bits entry table mapping raw sensor values to 8-bit output"""
+    levels = 1 << bits
+    black_point, white_point = clamp_points(black_point, white_point, levels)
+    values = np.arange(levels, dtype=np.float64)
+    normalised = np.clip((values - black_point) / (white_point - black_point), 0.0, 1.0)
+    if curve == "gamma":
+        normalised = normalised ** (1.0 / max(float(gamma), 0.01))
+    return np.round(normalised * 255).astype(np.uint8)
+
+
+class ToneMapper:
+    """Maps raw Bayer values to 8 bits through a lookup table rebuilt only when the curve changes.
+
+    Linear curves on full frames use an equivalent subtract and scale in
+    OpenCV, which is much cheaper than a 12-bit table lookup; everything else
+    goes through the table with a single np.take per plane.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.curve_key = None
+        self.configure()
+
+    def configure(self, curve="linear", gamma=2.2, black_point=0, white_point=4095):
+        """Rebuild the tables if the curve settings changed. Returns True if they were rebuilt."""
+        if curve not in TONE_CURVES:
+            print(f"Invalid tone curve: {curve}")
+            curve = "linear"
+        black_point, white_point = clamp_points(black_point, white_point)
+        key = (curve, float(gamma), black_point, white_point)
+        with self.lock:
+            if key == self.curve_key:
+                return False
+            lut = build_tone_lut(curve, gamma, black_point, white_point)
+            # 8-bit pixel formats carry the top 8 of the 12 bits
+            lut8 = np.ascontiguousarray(lut[8::16])
+            self.state = (key, lut, lut8)
+            self.curve_key = key
+        print(f"Tone curve set to {curve} (gamma {gamma}, black {black_point}, white {white_point})")
+        return True
+
+    def table_for(self, dtype):
+        """The lookup table indexed by raw values of the given dtype"""
+        _, lut, lut8 = self.state
+        return lut8 if np.dtype(dtype) == np.uint8 else lut
+
+    def needs_scratch(self, dtype):
+        """True if apply() on raw values of this dtype uses a uint16 scratch array"""
+        (curve, _, black_point, _), _, _ = self.state
+        return np.dtype(dtype) == np.uint16 and curve == "linear" and black_point > 0
+
+    def apply(self, bayer, dst, scratch=None):
+        """Tone map a whole raw plane into the uint8 array dst.
+
+        scratch is an optional uint16 array of the same shape used by the
+        linear fast path.
+        """
+        (curve, _, black_point, white_point), lut, lut8 = self.state
+        if bayer.dtype == np.uint8:
+            return cv2.LUT(bayer, lut8, dst=dst)
+        if curve == "linear":
+            if black_point > 0:
+                if scratch is None:
+                    scratch = np.empty(bayer.shape, dtype=bayer.dtype)
+                cv2.subtract(bayer, black_point, dst=scratch)
+                bayer = scratch
+            cv2.convertScaleAbs(bayer, dst=dst, alpha=255 / (white_point - black_point))
+            return dst
+        np.take(lut, bayer, out=dst, mode='clip')
+        return dst
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+CATCH_UP_POLICIES = ("skip", "burst", "reschedule")
+
+
+class TriggerJitterStats:
+    """How late each trigger fired after its deadline, over the most recent triggers"""
+    def __init__(self, history=1000):
+        self.lock = threading.Lock()
+        self.lateness = deque(maxlen=history)
+        self.triggered = 0
+        self.skipped = 0
+
+    def reset(self):
+        with self.lock:
+            self.lateness.clear()
+            self.triggered = 0
+            self.skipped = 0
+
+    def record(self, lateness):
+        with self.lock:
+            self.lateness.append(lateness)
+            self.triggered += 1
+
+    def record_skipped(self, count):
+        with self.lock:
+            self.skipped += count
+
+    def snapshot(self):
+        with self.lock:
+            lateness = np.array(self.lateness) * 1000
+            result = {"triggered": self.triggered, "skipped": self.skipped}
+        if lateness.size:
+            result.update({
+                "mean_ms": round(float(lateness.mean()), 3),
+                "p50_ms": round(float(np.percentile(lateness, 50)), 3),
+                "p99_ms": round(float(np.percentile(lateness, 99)), 3),
+                "max_ms": round(float(lateness.max()), 3)
+            })
+        return result
+
+
+class TriggerScheduler:
+    """Periodic trigger deadlines at start + n * interval on the monotonic clock.
+
+    Deadlines never drift, since each one is computed from the start of the
+    schedule rather than from the last trigger, and wall clock steps (such as
+    MAVLink time sync) do not move them. wait() sleeps until the next deadline
+    or until wake() is called for a state change. trigger_at() adds a single
+    deadline at any time, used for predicted distance triggers.
+
+    When the caller falls behind by whole intervals the catch-up policy
+    decides what happens: "skip" fires once and moves on to the next deadline
+    still ahead, "burst" fires every missed deadline back to back, and
+    "reschedule" fires once and starts a new schedule from now.
+    """
+    def __init__(self, catch_up="skip"):
+        self.condition = threading.Condition()
+        self.interval = None
+        self.start = 0.0
+        self.index = 0
+        self.one_shot = None
+        self.woken = False
+        self.catch_up = catch_up
+        self.stats = TriggerJitterStats()
+
+    def set_catch_up(self, policy):
+        if policy not in CATCH_UP_POLICIES:
+            print(f"Invalid trigger catch-up policy: {policy}")
+            return False
+        if policy != self.catch_up:
+            self.catch_up = policy
+            print(f"Trigger catch-up policy set to {policy}")
+        return True
+
+    def configure(self, interval):
+        """Start a new schedule whose first deadline is now, or stop periodic triggers with interval None"""
+        with self.condition:
+            self.interval = interval if interval and interval > 0 else None
+            self.start = time.monotonic()
+            self.index = 0
+            self.one_shot = None
+            self.condition.notify_all()
+        self.stats.reset()
+
+    def trigger_at(self, when):
+        """Set a single extra deadline at time.monotonic() time when, replacing the previous one, or clear it with None"""
+        with self.condition:
+            self.one_shot = when
+            self.condition.notify_all()
+
+    def wake(self):
+        """Make wait() return early, e.g. after a state change or a distance event"""
+        with self.condition:
+            self.woken = True
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Sleep until the next deadline is due and return it, or return None when woken or after timeout seconds"""
+        give_up = time.monotonic() + timeout if timeout is not None else None
+        with self.condition:
+            while True:
+                if self.woken:
+                    self.woken = False
+                    return None
+                now = time.monotonic()
+                delay = None
+                if self.one_shot is not None:
+                    if now >= self.one_shot:
+                        deadline, self.one_shot = self.one_shot, None
+                        return deadline
+                    delay = self.one_shot - now
+                if self.interval:
+                    deadline = self.start + self.index * self.interval
+                    if now >= deadline:
+                        return self._take_deadline(deadline, now)
+                    delay = min(delay, deadline - now) if delay is not None else deadline - now
+                if give_up is not None:
+                    if now >= give_up:
+                        return None
+                    delay = min(delay, give_up - now) if delay is not None else give_up - now
+                self.condition.wait(delay)
+
+    def _take_deadline(self, deadline, now):
+        missed = int((now - deadline) // self.interval)
+        if missed and self.catch_up == "skip":
+            self.index += missed
+            deadline = self.start + self.index * self.interval
+            self.stats.record_skipped(missed)
+        elif missed and self.catch_up == "reschedule":
+            self.start = deadline = now
+            self.index = 0
+            self.stats.record_skipped(missed)
+        self.index += 1
+        return deadline
+
+    def record_trigger(self, deadline):
+        """Note that the trigger for deadline has just fired"""
+        self.stats.record(max(0.0, time.monotonic() - deadline))
+
+    def get_stats(self):
+        result = self.stats.snapshot()
+        result["interval_s"] = self.interval
+        result["catch_up"] = self.catch_up
+        return result
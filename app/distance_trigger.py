@@ -0,0 +1,186 @@
+"""Distance triggering that predicts when the next photo is due.
+
+Each GLOBAL_POSITION_INT fix adds the distance travelled since the previous
+fix, and its vx/vy ground velocity gives the time at which the remaining
+distance to the threshold will have been covered. That time is handed to the
+trigger scheduler and refined by every later fix, so photos are not limited
+to the 4-10 Hz rate at which fixes arrive.
+
+Once the fix after a photo arrives, the photo's position is interpolated
+between the two fixes around it. The spacing to the previous photo is then
+logged against the target in <transect>/distance_spacing.csv.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+
+EARTH_RADIUS = 6371000
+# Below this ground speed in m/s there is no useful prediction, e.g. while holding station
+MIN_SPEED = 0.05
+SPACING_LOG_NAME = "distance_spacing.csv"
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between two positions in degrees"""
+    lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class SpacingLog:
+    """Actual against target spacing of the photos of one transect"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, folder=None):
+        with self.lock:
+            self.path = os.path.join(folder, SPACING_LOG_NAME) if folder else None
+            self.transect = os.path.basename(folder) if folder else None
+            self.photos = 0
+            self.total_spacing = 0.0
+            self.total_error = 0.0
+            self.total_squared_error = 0.0
+            self.max_error = 0.0
+        if self.path and not os.path.exists(self.path):
+            with open(self.path, 'w') as f:
+                f.write("frame_index,time,target_m,actual_m,error_m,speed_m_s\n")
+
+    def record(self, frame_index, wall_time, target, actual, speed):
+        error = actual - target
+        with self.lock:
+            self.photos += 1
+            self.total_spacing += actual
+            self.total_error += error
+            self.total_squared_error += error * error
+            self.max_error = max(self.max_error, abs(error))
+            path = self.path
+        print(f"Photo {frame_index} spacing {actual:.3f} m (target {target:.3f} m, error {error:+.3f} m)")
+        if path:
+            try:
+                with open(path, 'a') as f:
+                    f.write(f"{frame_index},{wall_time.isoformat()},{target:.3f},{actual:.3f},{error:.3f},{speed:.3f}\n")
+            except OSError as e:
+                print(f"Error writing distance spacing log: {e}")
+
+    def snapshot(self):
+        with self.lock:
+            photos = self.photos
+            return {
+                "transect": self.transect,
+                "photos": photos,
+                "mean_spacing_m": round(self.total_spacing / photos, 3) if photos else None,
+                "mean_error_m": round(self.total_error / photos, 3) if photos else None,
+                "rms_error_m": round(math.sqrt(self.total_squared_error / photos), 3) if photos else None,
+                "max_abs_error_m": round(self.max_error, 3)
+            }
+
+
+class DistanceTrigger:
+    """Tracks the distance travelled since the last photo and predicts when the next one is due.
+
+    on_trigger_time(when) is called after every fix with the time.monotonic()
+    time the next photo should be taken, or None when no prediction can be
+    made, and again after record_photo() is called for a triggered photo.
+    It is called with the trigger's lock held and must not call back into it.
+    """
+    def __init__(self, threshold=1.0):
+        self.lock = threading.Lock()
+        self.threshold = threshold
+        self.on_trigger_time = None
+        # (received time.monotonic(), latitude, longitude, ground speed m/s) of the latest fix
+        self.last_fix = None
+        # Metres travelled since the last photo, as of the latest fix; negative just after a photo between fixes
+        self.travelled = 0.0
+        self.pending_photos = []
+        self.last_photo_position = None
+        self.spacing = SpacingLog()
+
+    def set_threshold(self, meters):
+        with self.lock:
+            self.threshold = float(meters)
+
+    def begin_transect(self, folder):
+        """Start counting from zero and log spacing into a new transect folder"""
+        with self.lock:
+            self.travelled = 0.0
+            self.pending_photos = []
+            self.last_photo_position = None
+        self.spacing.reset(folder)
+
+    def on_fix(self, position_data, received=None):
+        """Process a GLOBAL_POSITION_INT message and publish the predicted trigger time"""
+        received = received if received is not None else time.monotonic()
+        latitude = position_data['lat'] / 1e7
+        longitude = position_data['lon'] / 1e7
+        # vx and vy are north and east ground velocity in cm/s. Spacing is measured over the ground,
+        # like the distance between fixes, so vz is left out.
+        speed = math.hypot(position_data.get('vx', 0), position_data.get('vy', 0)) / 100
+        fix = (received, latitude, longitude, speed)
+        with self.lock:
+            if self.last_fix:
+                self.travelled += haversine(self.last_fix[1], self.last_fix[2], latitude, longitude)
+                resolved = self._resolve_photos(self.last_fix, fix)
+            else:
+                resolved = []
+            self.last_fix = fix
+            self._publish()
+        for frame_index, wall_time, spacing in resolved:
+            self.spacing.record(frame_index, wall_time, self.threshold, spacing, speed)
+
+    def _publish(self):
+        # Called with the lock held, so a fix and a photo cannot hand over their predictions out of order
+        if self.on_trigger_time:
+            self.on_trigger_time(self._predict())
+
+    def _predict(self):
+        received, _, _, speed = self.last_fix
+        remaining = self.threshold - self.travelled
+        if remaining <= 0:
+            return received
+        if speed < MIN_SPEED:
+            return None
+        return received + remaining / speed
+
+    def record_photo(self, frame_index, taken=None):
+        """Restart the distance count at a photo taken at time.monotonic() time taken"""
+        taken = taken if taken is not None else time.monotonic()
+        with self.lock:
+            if self.last_fix is None:
+                return
+            received, _, _, speed = self.last_fix
+            # The photo was taken this far past the latest fix, so that much of the next leg is already behind it
+            self.travelled = -speed * max(0.0, taken - received)
+            self.pending_photos.append((frame_index, taken, datetime.now()))
+            # Predict the next photo now rather than at the next fix, which may be more than one spacing away
+            self._publish()
+
+    def _resolve_photos(self, previous, fix):
+        """Interpolate the position of photos taken between two fixes. Returns (frame_index, wall time, spacing) tuples."""
+        resolved = []
+        waiting = []
+        for frame_index, taken, wall_time in self.pending_photos:
+            if taken > fix[0]:
+                waiting.append((frame_index, taken, wall_time))
+                continue
+            span = fix[0] - previous[0]
+            fraction = min(max((taken - previous[0]) / span, 0.0), 1.0) if span > 0 else 1.0
+            position = (previous[1] + (fix[1] - previous[1]) * fraction,
+                        previous[2] + (fix[2] - previous[2]) * fraction)
+            if self.last_photo_position:
+                resolved.append((frame_index, wall_time, haversine(*self.last_photo_position, *position)))
+            self.last_photo_position = position
+        self.pending_photos = waiting
+        return resolved
+
+    def get_stats(self):
+        result = self.spacing.snapshot()
+        with self.lock:
+            result["target_m"] = self.threshold
+            result["travelled_m"] = round(self.travelled, 3)
+        return result
@@ -0,0 +1,200 @@
+"""DNG files written straight from raw Bayer frames.
+
+The file is a little-endian TIFF whose first IFD holds the whole frame as a
+single uncompressed strip at the end of the file, so a pooled uint16 buffer
+goes to disk as it is behind a small header in one writev call. The header
+carries the RGGB CFA pattern, black and white levels, colour matrix and the
+EXIF and GPS fields ExifManager.create_exif_dict produces for JPEGs. The
+colour values come from the "dng" section of settings/exif_data.json.
+"""
+import os
+import struct
+import numpy as np
+import piexif
+
+
+# TIFF field types
+BYTE, ASCII, SHORT, LONG, RATIONAL, UNDEFINED, SLONG, SRATIONAL = 1, 2, 3, 4, 5, 7, 9, 10
+TYPE_SIZES = {BYTE: 1, ASCII: 1, SHORT: 2, LONG: 4, RATIONAL: 8, UNDEFINED: 1, SLONG: 4, SRATIONAL: 8}
+TYPE_FORMATS = {BYTE: "B", SHORT: "H", LONG: "I", SLONG: "i"}
+
+EXIF_IFD_POINTER = 34665
+GPS_IFD_POINTER = 34853
+
+# Inverse of the sRGB to XYZ (D65) matrix: camera RGB treated as linear sRGB until the sensor is calibrated
+DEFAULT_COLOR_MATRIX = [3.2406, -1.5372, -0.4986, -0.9689, 1.8758, 0.0415, 0.0557, -0.2040, 1.0570]
+D65 = 21
+RGGB = (0, 1, 1, 2)
+
+
+def _rational(value, denominator=10000):
+    """A (numerator, denominator) pair for an int, float or an existing pair"""
+    if isinstance(value, (tuple, list)):
+        return int(value[0]), int(value[1])
+    if float(value).is_integer():
+        return int(value), 1
+    return int(round(value * denominator)), denominator
+
+
+def _encode_value(field_type, value):
+    """Bytes and count of a tag value in the piexif conventions for its type"""
+    if field_type == ASCII:
+        data = value.encode() if isinstance(value, str) else bytes(value)
+        data += b"\0"
+        return data, len(data)
+    if field_type in (BYTE, UNDEFINED) and isinstance(value, (bytes, bytearray)):
+        return bytes(value), len(value)
+    if field_type in (RATIONAL, SRATIONAL):
+        pairs = [value] if isinstance(value, tuple) and len(value) == 2 and not isinstance(value[0], tuple) else value
+        pairs = [_rational(pair) for pair in pairs]
+        fmt = "I" if field_type == RATIONAL else "i"
+        return struct.pack("<" + fmt * 2 * len(pairs), *[part for pair in pairs for part in pair]), len(pairs)
+    values = list(value) if isinstance(value, (tuple, list)) else [value]
+    return struct.pack("<" + TYPE_FORMATS.get(field_type, "B") * len(values), *[int(v) for v in values]), len(values)
+
+
+def _ifd_size(entries):
+    """Bytes taken by an IFD and the values that do not fit in its entries"""
+    size = 2 + 12 * len(entries) + 4
+    for _, _, _, data in entries:
+        if len(data) > 4:
+            size += len(data) + (len(data) & 1)
+    return size
+
+
+def _pack_ifd(entries, offset):
+    """Serialise an IFD placed at offset, with its out-of-line values right after it"""
+    entries = sorted(entries)
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    table = [struct.pack("<H", len(entries))]
+    values = []
+    for tag, field_type, count, data in entries:
+        if len(data) <= 4:
+            table.append(struct.pack("<HHI", tag, field_type, count) + data.ljust(4, b"\0"))
+        else:
+            table.append(struct.pack("<HHII", tag, field_type, count, data_offset))
+            padded = data + b"\0" * (len(data) & 1)
+            values.append(padded)
+            data_offset += len(padded)
+    table.append(struct.pack("<I", 0))
+    return b"".join(table + values)
+
+
+def _entries(tags, ifd_name):
+    """IFD entries for a piexif dictionary section, using piexif's field types"""
+    entries = []
+    for tag, value in tags.items():
+        field_type = piexif.TAGS[ifd_name][tag]["type"]
+        data, count = _encode_value(field_type, value)
+        entries.append((tag, field_type, count, data))
+    return entries
+
+
+def _entry(tag, field_type, value):
+    data, count = _encode_value(field_type, value)
+    return tag, field_type, count, data
+
+
+class DngWriter:
+    """Writes raw Bayer frames as DNG files with the same EXIF and GPS data as the JPEGs"""
+    def __init__(self, exif_manager):
+        self.exif_manager = exif_manager
+
+    @property
+    def dng_settings(self):
+        return self.exif_manager.exif_settings.get("dng", {})
+
+    def _levels(self, dtype):
+        """Black and white levels of a frame, scaled down for 8-bit frames"""
+        dng_settings = self.dng_settings
+        black = int(dng_settings.get("BlackLevel", 0))
+        white = int(dng_settings.get("WhiteLevel", 4095))
+        if np.dtype(dtype) == np.uint8:
+            return black >> 4, min(white >> 4, 255)
+        return black, white
+
+    def build_header(self, shape, dtype, now, telemetry=None, camera_settings=None):
+        """TIFF header and IFDs for a (height, width) Bayer frame whose pixels follow directly after"""
+        height, width = shape
+        bits = np.dtype(dtype).itemsize * 8
+        exif_dict = self.exif_manager.create_exif_dict(now, telemetry, camera_settings)
+        black, white = self._levels(dtype)
+        exif_settings = self.exif_manager.exif_settings
+        dng_settings = exif_settings.get("dng", {})
+        camera = exif_settings.get("camera", {})
+        model = f"{camera.get('Make', '')} {camera.get('Model', '')}".strip() or "Camera"
+
+        exif_entries = _entries(exif_dict["Exif"], "Exif")
+        gps_entries = _entries(exif_dict["GPS"], "GPS")
+        strip_bytes = height * width * bits // 8
+
+        def image_entries(exif_offset, gps_offset, strip_offset):
+            entries = _entries(exif_dict["0th"], "Image") + [
+                _entry(254, LONG, 0),                   # NewSubfileType: main image
+                _entry(256, LONG, width),
+                _entry(257, LONG, height),
+                _entry(258, SHORT, bits),
+                _entry(259, SHORT, 1),                  # Uncompressed
+                _entry(262, SHORT, 32803),              # Colour filter array
+                _entry(273, LONG, strip_offset),
+                _entry(274, SHORT, 1),
+                _entry(277, SHORT, 1),
+                _entry(278, LONG, height),
+                _entry(279, LONG, strip_bytes),
+                _entry(284, SHORT, 1),
+                _entry(33421, SHORT, (2, 2)),           # CFARepeatPatternDim
+                _entry(33422, BYTE, RGGB),              # CFAPattern
+                _entry(EXIF_IFD_POINTER, LONG, exif_offset),
+                _entry(50706, BYTE, (1, 4, 0, 0)),      # DNGVersion
+                _entry(50707, BYTE, (1, 1, 0, 0)),      # DNGBackwardVersion
+                _entry(50708, ASCII, model),            # UniqueCameraModel
+                _entry(50714, LONG, black),
+                _entry(50717, LONG, white),
+                _entry(50721, SRATIONAL, dng_settings.get("ColorMatrix1", DEFAULT_COLOR_MATRIX)),
+                _entry(50728, RATIONAL, dng_settings.get("AsShotNeutral", [1, 1, 1])),
+                _entry(50778, SHORT, dng_settings.get("CalibrationIlluminant1", D65))
+            ]
+            if gps_entries:
+                entries.append(_entry(GPS_IFD_POINTER, LONG, gps_offset))
+            return entries
+
+        # Offsets do not change any IFD's size, so lay out with placeholders and then fill them in
+        image_offset = 8
+        exif_offset = image_offset + _ifd_size(image_entries(0, 0, 0))
+        gps_offset = exif_offset + _ifd_size(exif_entries)
+        strip_offset = gps_offset + (_ifd_size(gps_entries) if gps_entries else 0)
+        # Start the pixels on a 16-byte boundary
+        padding = -strip_offset % 16
+        strip_offset += padding
+
+        parts = [b"II*\0" + struct.pack("<I", image_offset),
+                 _pack_ifd(image_entries(exif_offset, gps_offset, strip_offset), image_offset),
+                 _pack_ifd(exif_entries, exif_offset)]
+        if gps_entries:
+            parts.append(_pack_ifd(gps_entries, gps_offset))
+        parts.append(b"\0" * padding)
+        return b"".join(parts)
+
+    def write(self, filename, bayer, now, telemetry=None, camera_settings=None):
+        """Write a Bayer frame as a DNG file with one writev of the header and the frame buffer. Returns the file size."""
+        if bayer.ndim != 2:
+            raise ValueError(f"DNG needs a single-plane Bayer frame, got shape {bayer.shape}")
+        # No copy for the usual contiguous little-endian pooled buffer
+        pixels = np.ascontiguousarray(bayer, dtype=bayer.dtype.newbyteorder('<'))
+        header = self.build_header(pixels.shape, pixels.dtype, now, telemetry, camera_settings)
+        chunks = [memoryview(header), memoryview(pixels.reshape(-1)).cast('B')]
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            total = 0
+            while chunks:
+                written = os.writev(fd, chunks)
+                total += written
+                # Carry on after a short write
+                while chunks and written >= len(chunks[0]):
+                    written -= len(chunks[0])
+                    chunks.pop(0)
+                if chunks and written:
+                    chunks[0] = chunks[0][written:]
+        finally:
+            os.close(fd)
+        return total
@@ -1,32 +1,19 @@
-import os
 import json
+import struct
 import piexif
 from datetime import datetime
+from settings_manager import SettingsManager
 
 class ExifManager:
     def __init__(self, settings_manager, camera_hardware_controller=None):
-        self.settings_manager = settings_manager
+        # Saver processes and offline tools have no settings manager of their own; the settings stores are shared anyway
+        self.settings_manager = settings_manager or SettingsManager()
         self.camera_hardware_controller = camera_hardware_controller
-        self.exif_settings_path = os.path.join(
-            os.path.dirname(os.path.abspath(__file__)), 
-            'settings', 
-            'exif_data.json'
-        )
-        self.exif_settings = self._load_exif_settings()
-        
-    def _load_exif_settings(self):
-        """Load EXIF settings from JSON file."""
-        try:
-            with open(self.exif_settings_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading EXIF settings: {e}")
-            return {
-                "camera": {}, 
-                "lens": {}, 
-                "exposure": {}, 
-                "other": {}
-            }
+
+    @property
+    def exif_settings(self):
+        """EXIF settings from the settings store, which picks up edits to exif_data.json"""
+        return self.settings_manager.get_exif_settings()
             
     def _get_string_value(self, settings, key):
         """Extract string value from setting which might be an EnumEntry object"""
@@ -55,22 +42,26 @@ class ExifManager:
         
         return ((deg, 1), (min, 1), (sec_int, sec_multiplier)), loc_value
     
-    def create_exif_dict(self, now, telemetry=None):
-        """Create EXIF dictionary with camera settings and optional telemetry."""
-        exif_dict = {"0th":{}, "Exif":{}, "GPS":{}, "1st":{}, "thumbnail":None}
-
-        current_settings = {}
+    def get_current_settings(self):
+        """Camera feature values recorded in the EXIF data."""
         try:
             if self.camera_hardware_controller:
-                current_settings = self.camera_hardware_controller.get_camera_settings()
-            else:
-                params_list = self.settings_manager.get_parameters_definitions()["parameters"]
-                current_settings = {param["id"]: param["value"] for param in params_list}
+                return self.camera_hardware_controller.get_camera_settings()
+            params_list = self.settings_manager.get_parameters_definitions()["parameters"]
+            return {param["id"]: param["value"] for param in params_list}
         except Exception as e:
             print(f"Could not get current camera settings: {e}")
+            return {}
+
+    def create_exif_dict(self, now, telemetry=None, camera_settings=None):
+        """Create EXIF dictionary with camera settings and optional telemetry."""
+        exif_dict = {"0th":{}, "Exif":{}, "GPS":{}, "1st":{}, "thumbnail":None}
+
+        current_settings = camera_settings if camera_settings is not None else self.get_current_settings()
             
         # Add camera information
-        camera = self.exif_settings.get("camera", {})
+        exif_settings = self.exif_settings
+        camera = exif_settings.get("camera", {})
         exif_dict["0th"][piexif.ImageIFD.Make] = camera.get("Make", "").encode()
         exif_dict["0th"][piexif.ImageIFD.Model] = camera.get("Model", "").encode()
         exif_dict["0th"][piexif.ImageIFD.Software] = camera.get("Software", "").encode()
@@ -79,7 +70,7 @@ class ExifManager:
         exif_dict["0th"][piexif.ImageIFD.Copyright] = camera.get("Copyright", "").encode()
         
         # Add lens information
-        lens = self.exif_settings.get("lens", {})
+        lens = exif_settings.get("lens", {})
         exif_dict["Exif"][piexif.ExifIFD.LensMake] = lens.get("LensMake", "").encode()
         exif_dict["Exif"][piexif.ExifIFD.LensModel] = lens.get("LensModel", "").encode()
         exif_dict["Exif"][piexif.ExifIFD.FocalLength] = tuple(lens.get("FocalLength", [1, 100]))
@@ -168,15 +159,30 @@ class ExifManager:
         except Exception as e:
             print(f"Error adding GPS data to EXIF: {e}")
     
-    def apply_exif_to_file(self, filename, now, telemetry=None):
-        """Apply EXIF data to an image file."""
+    def splice_exif(self, jpeg_bytes, exif_bytes):
+        """Return JPEG bytes with the EXIF APP1 segment placed directly after SOI.
+
+        Mirrors piexif.insert: an existing JFIF APP0 or EXIF APP1 header segment
+        is replaced, since EXIF files should not carry a JFIF header.
+        """
+        data = memoryview(jpeg_bytes).cast('B')
+        if bytes(data[0:2]) != b"\xff\xd8":
+            raise ValueError("Not a JPEG stream")
+
+        body_start = 2
+        marker = bytes(data[2:4])
+        if marker == b"\xff\xe0" or (marker == b"\xff\xe1" and bytes(data[6:12]) == b"Exif\x00\x00"):
+            segment_length = struct.unpack(">H", data[4:6])[0]
+            body_start = 4 + segment_length
+
+        app1 = b"\xff\xe1" + struct.pack(">H", len(exif_bytes) + 2) + exif_bytes
+        return b"".join((b"\xff\xd8", app1, data[body_start:]))
+
+    def build_jpeg_with_exif(self, jpeg_bytes, now, telemetry=None, camera_settings=None):
+        """Return the in-memory JPEG with its EXIF data spliced in."""
         try:
-            exif_dict = self.create_exif_dict(now, telemetry)
-            exif_bytes = piexif.dump(exif_dict)
-            piexif.insert(exif_bytes, filename)
-            return True
+            exif_bytes = piexif.dump(self.create_exif_dict(now, telemetry, camera_settings))
+            return self.splice_exif(jpeg_bytes, exif_bytes)
         except Exception as e:
-            print(f"Error applying EXIF data: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
\ No newline at end of file
+            print(f"Error building EXIF data, writing JPEG without it: {e}")
+            return jpeg_bytes
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+class FrameSaveQueue:
+    """FIFO of frames waiting to be written, bounded by total bytes rather than item count.
+
+    Each entry is stored with its size so the queue can hold as many frames as
+    fit in the memory budget. A single frame larger than the budget is still
+    accepted when the queue is empty so saving never deadlocks, and entries
+    that cost nothing (frames spilled to disk) are always accepted.
+
+    A spilled frame holds its place in the queue while it is being written
+    out, so frames are still taken in capture order: get() waits until the
+    oldest entry is ready.
+    """
+    def __init__(self, budget_bytes=256 * 1024 * 1024):
+        self.budget_bytes = int(budget_bytes)
+        self.condition = threading.Condition()
+        self.items = deque()
+        self.current_bytes = 0
+        self.high_water_bytes = 0
+
+    def set_budget(self, budget_bytes):
+        with self.condition:
+            self.budget_bytes = int(budget_bytes)
+            self.condition.notify_all()
+        print(f"Save queue memory budget set to {self.budget_bytes / (1024 * 1024):.0f} MB")
+
+    def _fits(self, nbytes):
+        return not self.items or nbytes == 0 or self.current_bytes + nbytes <= self.budget_bytes
+
+    def _head_ready(self):
+        if not self.items:
+            return False
+        ready = getattr(self.items[0][0][0], "ready", None)
+        return ready is None or ready.is_set()
+
+    def put(self, item, nbytes, block=False, timeout=None):
+        """Add an item costing nbytes. Returns False if it does not fit within the budget in time."""
+        with self.condition:
+            if not self._fits(nbytes):
+                if not block:
+                    return False
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._fits(nbytes):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+
+            self.items.append((item, nbytes))
+            self.current_bytes += nbytes
+            self.high_water_bytes = max(self.high_water_bytes, self.current_bytes)
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, blocking until one is available"""
+        with self.condition:
+            if not self.condition.wait_for(self._head_ready, timeout=timeout):
+                return None
+            item, nbytes = self.items.popleft()
+            self.current_bytes -= nbytes
+            self.condition.notify_all()
+            return item
+
+    def pop_oldest(self):
+        """Remove and return the oldest item without waiting, or None if the queue is empty or it is not ready"""
+        with self.condition:
+            if not self._head_ready():
+                return None
+            item, nbytes = self.items.popleft()
+            self.current_bytes -= nbytes
+            self.condition.notify_all()
+            return item
+
+    def remove(self, item):
+        """Take an item out of the queue wherever it is, e.g. a spilled frame that could not be written"""
+        with self.condition:
+            for index, (queued, nbytes) in enumerate(self.items):
+                if queued is item:
+                    del self.items[index]
+                    self.current_bytes -= nbytes
+                    self.condition.notify_all()
+                    return True
+            return False
+
+    def notify_ready(self):
+        """Wake get() after a queued entry became ready"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def qsize(self):
+        with self.condition:
+            return len(self.items)
+
+    def get_status(self):
+        with self.condition:
+            return {
+                "depth": len(self.items),
+                "bytes": self.current_bytes,
+                "budget_bytes": self.budget_bytes,
+                "high_water_bytes": self.high_water_bytes,
+                "utilisation": round(self.current_bytes / self.budget_bytes, 3) if self.budget_bytes else 0.0
+            }
+
+
+class SpilledFrame:
+    """Raw frame parked in a disk overflow area because the save queue was full.
+
+    Behaves like a pooled buffer for the saver: it exposes the frame as .array
+    and release() removes the overflow file once the frame has been written.
+    shape and dtype are known without reading the file back. reserve() makes
+    the entry that is queued at capture time, and ready is set once write()
+    has put the frame on disk. on_release is called after the file is removed.
+    """
+    nbytes = 0
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ready = threading.Event()
+        self.on_release = None
+        self._array = None
+
+    @classmethod
+    def reserve(cls, directory, frame_index, array):
+        return cls(os.path.join(directory, f"IMG_{frame_index}.npy"), array.shape, array.dtype)
+
+    def write(self, array):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.save(self.path, array)
+        self.ready.set()
+
+    @property
+    def array(self):
+        if self._array is None:
+            self._array = np.load(self.path)
+        return self._array
+
+    def release(self):
+        self._array = None
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"Could not remove overflow file {self.path}: {e}")
+        if self.on_release:
+            self.on_release()
+
+
+class FrameDropStats:
+    """Per-transect record of frames that were triggered for saving but never queued"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, transect=None):
+        with self.lock:
+            self.transect = transect
+            self.dropped = 0
+            self.spilled = 0
+            self.by_reason = {}
+            self.last_dropped_index = None
+
+    def record_drop(self, frame_index, reason):
+        with self.lock:
+            self.dropped += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+            self.last_dropped_index = frame_index
+
+    def record_spill(self):
+        with self.lock:
+            self.spilled += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "transect": self.transect,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "by_reason": dict(self.by_reason),
+                "last_dropped_index": self.last_dropped_index
+            }
@@ -0,0 +1,526 @@
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from queue import Empty
+import cv2
+import numpy as np
+from camera.demosaic import demosaic_bayer8
+from camera.frame_pipeline import StageMetrics
+from camera.tone_mapping import ToneMapper
+from dng_writer import DngWriter
+from exif_manager import ExifManager
+from raw_container import RawFrameWriter, encode_frame, frame_layout, write_payload
+
+
+SAVER_MODES = ("threads", "processes")
+SAVE_FORMATS = ("jpeg", "raw12", "dng", "jpeg+dng")
+
+
+def _job_array(source, attached):
+    """Map the frame a job refers to: a shared memory slot, a spilled .npy file or a pickled array"""
+    kind = source[0]
+    if kind == "shared":
+        _, name, offset, shape, dtype = source
+        block = attached.get(name)
+        if block is None:
+            # Keep a few mappings; the raw pool is only replaced when its size changes
+            while len(attached) >= 4:
+                stale = attached.pop(next(iter(attached)))
+                try:
+                    stale.close()
+                except BufferError:
+                    pass
+            block = attached[name] = shared_memory.SharedMemory(name=name)
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+    if kind == "file":
+        return np.load(source[1])
+    return source[1]
+
+
+def _save_process_main(jobs, results):
+    """Saver process: demosaic, encode and write the frames described by jobs, reporting timings on results"""
+    exif_manager = ExifManager(None)
+    dng_writer = DngWriter(exif_manager)
+    tone_mapper = ToneMapper()
+    attached = {}
+    scratch = {}
+    packed = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        timings = {}
+        try:
+            array = _job_array(job["source"], attached)
+            plan = job["plan"]
+            if plan["kind"] == "raw":
+                step = time.perf_counter()
+                nbytes = frame_layout(array.shape, array.dtype)[1]
+                if packed is None or packed.size != nbytes:
+                    packed = np.empty(nbytes, dtype=np.uint8)
+                payload = encode_frame(array, packed if array.dtype == np.uint16 else None)
+                timings["pack"] = (time.perf_counter() - step) * 1000
+                step = time.perf_counter()
+                write_payload(plan["chunk_path"], plan["offset"], payload)
+                timings["write"] = (time.perf_counter() - step) * 1000
+                results.put((job["ticket"], os.getpid(), timings, None))
+                continue
+
+            files = plan["files"]
+            if "dng" in files:
+                step = time.perf_counter()
+                dng_writer.write(files["dng"][0], array, job["now"], job["telemetry"], job["camera_settings"])
+                timings["dng"] = (time.perf_counter() - step) * 1000
+            if "jpeg" not in files:
+                results.put((job["ticket"], os.getpid(), timings, None))
+                continue
+
+            if array.ndim == 3:
+                image = array
+            else:
+                step = time.perf_counter()
+                tone_mapper.configure(*job["tone_curve"])
+                if scratch.get("shape") != array.shape:
+                    scratch = {
+                        "shape": array.shape,
+                        "bayer8": np.empty(array.shape, dtype=np.uint8),
+                        "bayer16": np.empty(array.shape, dtype=np.uint16),
+                        "rgb": np.empty(array.shape + (3,), dtype=np.uint8)
+                    }
+                tone_mapper.apply(array, scratch["bayer8"], scratch["bayer16"])
+                image = demosaic_bayer8(scratch["bayer8"], scratch["rgb"], job["backend"])
+                timings["demosaic"] = (time.perf_counter() - step) * 1000
+
+            step = time.perf_counter()
+            success, jpeg = cv2.imencode('.jpg', image)
+            if not success:
+                raise RuntimeError(f"JPEG encoding failed for frame {job['frame_index']}")
+            timings["encode"] = (time.perf_counter() - step) * 1000
+
+            step = time.perf_counter()
+            data = exif_manager.build_jpeg_with_exif(jpeg, job["now"], job["telemetry"], job["camera_settings"])
+            timings["exif"] = (time.perf_counter() - step) * 1000
+
+            step = time.perf_counter()
+            with open(files["jpeg"][0], 'wb') as f:
+                f.write(data)
+            timings["write"] = (time.perf_counter() - step) * 1000
+            results.put((job["ticket"], os.getpid(), timings, None))
+        except Exception as e:
+            results.put((job["ticket"], os.getpid(), timings, str(e)))
+
+
+class FrameSaverPool:
+    """Workers that demosaic, encode and write queued frames in parallel.
+
+    In "threads" mode the workers are threads: OpenCV and file I/O release the
+    GIL, but NumPy glue and EXIF building still compete with the trigger loop
+    and web server. In "processes" mode the raw pool moves into shared memory
+    and worker processes receive only a small descriptor of each frame, while
+    a dispatcher and a collector thread in this process hand out frames and
+    release their slots.
+
+    Frames are taken from the save queue in order and each gets a ticket.
+    Workers write their JPEG and/or DNG under a temporary name and they are
+    only renamed to IMG_<index>_<timestamp>.jpg/.dng once every earlier
+    ticket has finished, so files still appear in frame order. DNG files
+    (see dng_writer.py) hold the raw Bayer frame with the JPEG's EXIF data.
+    With the raw12 save format frames are instead packed into the transect's
+    raw container (see raw_container.py) at offsets reserved in ticket order,
+    and their index records are appended in the same order.
+    """
+    def __init__(self, frame_save_queue, pipeline, camera_service, exif_manager, settings_manager, worker_count=2,
+                 mode="threads", job_timeout=60.0):
+        self.frame_save_queue = frame_save_queue
+        self.pipeline = pipeline
+        self.camera_service = camera_service
+        self.exif_manager = exif_manager
+        self.dng_writer = DngWriter(exif_manager)
+        self.worker_count = worker_count
+        self.mode = mode
+        self.job_timeout = job_timeout
+        self.started_mode = None
+        self.threads = {}
+        self.lock = threading.Lock()
+
+        self.ticket_lock = threading.Lock()
+        self.next_ticket = 0
+        self.commit_lock = threading.Lock()
+        self.finished = {}
+        self.next_commit = 0
+
+        self.processes = []
+        self.context = None
+        self.jobs = None
+        self.results = None
+        self.in_flight = None
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+
+        self.raw_writers = {}
+        self.raw_chunk_bytes = 1024 * 1024 * 1024
+        self.scratch = threading.local()
+
+        self.metrics = {
+            "pack": StageMetrics("pack"),
+            "demosaic": StageMetrics("demosaic"),
+            "encode": StageMetrics("encode"),
+            "exif": StageMetrics("exif"),
+            "write": StageMetrics("write"),
+            "dng": StageMetrics("dng")
+        }
+        self.worker_stats = {}
+        settings_manager.subscribe_app_settings(self._on_app_settings_changed)
+
+    def _on_app_settings_changed(self, app_settings):
+        mode = app_settings.get('saver_mode', self.mode)
+        if mode not in SAVER_MODES:
+            print(f"Invalid saver mode: {mode}")
+        elif mode != self.mode:
+            self.mode = mode
+            if self.started_mode:
+                print(f"Frame saver mode {mode} takes effect after a restart")
+        if 'saver_workers' in app_settings:
+            self.set_worker_count(app_settings['saver_workers'])
+        if 'raw_chunk_mb' in app_settings:
+            self.raw_chunk_bytes = int(float(app_settings['raw_chunk_mb']) * 1024 * 1024)
+
+    def set_worker_count(self, count):
+        """Grow or shrink the pool. Surplus threads exit after their current frame; process pools are sized at start."""
+        count = max(1, int(count))
+        with self.lock:
+            if count != self.worker_count:
+                print(f"Frame saver pool set to {count} workers")
+            self.worker_count = count
+            if self.started_mode == "threads":
+                self._start_workers()
+
+    def start(self):
+        """Start the workers. Call before the camera and MAVLink threads so saver processes fork from a quiet process."""
+        with self.lock:
+            if self.started_mode:
+                return
+            self.started_mode = self.mode
+            if self.mode == "processes":
+                self._start_processes()
+            else:
+                self._start_workers()
+        print(f"Frame saver started with {self.worker_count} {self.started_mode}")
+
+    def _start_workers(self):
+        for worker_id in range(self.worker_count):
+            thread = self.threads.get(worker_id)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._worker, args=(worker_id,), daemon=True,
+                                          name=f"frame-saver-{worker_id}")
+                self.threads[worker_id] = thread
+                thread.start()
+
+    def _start_processes(self):
+        self.pipeline.set_shared_raw(True)
+        # Fork rather than spawn: spawned children would re-run main.py's module-level setup
+        self.context = multiprocessing.get_context("fork")
+        # Children share our resource tracker only if it is running before they fork
+        resource_tracker.ensure_running()
+        self.jobs = self.context.Queue()
+        self.results = self.context.Queue()
+        self.in_flight = threading.Semaphore(2 * self.worker_count)
+        for worker_id in range(self.worker_count):
+            self.processes.append(self._spawn_process(worker_id))
+        for target in (self._dispatch, self._collect):
+            threading.Thread(target=target, daemon=True, name=f"frame-saver-{target.__name__.strip('_')}").start()
+
+    def _spawn_process(self, worker_id):
+        process = self.context.Process(target=_save_process_main, args=(self.jobs, self.results), daemon=True,
+                                  name=f"frame-saver-{worker_id}")
+        process.start()
+        return process
+
+    def _take(self):
+        """Get the next frame with a ticket numbering it in queue order and a plan of where it goes.
+
+        The plan is None when nothing is being recorded.
+        """
+        with self.ticket_lock:
+            item = self.frame_save_queue.get(timeout=0.5)
+            if item is None:
+                return None, None, None
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            buffer, now, frame_index, telemetry = item
+            try:
+                # Only the frame's shape is needed here, so a spilled frame is not read back under the lock
+                plan = self._plan(buffer, now, frame_index, telemetry)
+            except Exception as e:
+                print(f"Error preparing to save frame {frame_index}: {e}")
+                plan = None
+            return ticket, item, plan
+
+    def _plan(self, buffer, now, frame_index, telemetry, save_format=None):
+        folder = self.camera_service.current_recording_folder
+        if not folder:
+            return None
+        save_format = save_format or self.pipeline.app_settings.get('save_format', 'jpeg')
+        # Frames converted to RGB by the VmbPy backend can only be saved as JPEG
+        if len(buffer.shape) != 2:
+            save_format = "jpeg"
+        if save_format == "raw12":
+            writer = self._raw_writer(folder)
+            chunk_path, offset = writer.reserve(frame_layout(buffer.shape, buffer.dtype)[1])
+            record = RawFrameWriter.make_record(chunk_path, offset, buffer.shape, buffer.dtype, frame_index, now,
+                                                telemetry, self.exif_manager.get_current_settings())
+            return {"kind": "raw", "folder": folder, "chunk_path": chunk_path, "offset": offset, "record": record,
+                    "label": f"{os.path.basename(chunk_path)}@{offset}"}
+        timestamp = now.strftime('%Y_%m_%d_%H-%M-%S') + f'-{int(now.microsecond / 10000):02d}'
+        files = {}
+        for extension in save_format.split("+"):
+            if extension not in ("jpeg", "dng"):
+                continue
+            suffix = "jpg" if extension == "jpeg" else extension
+            files[extension] = (os.path.join(folder, f".IMG_{frame_index}.{suffix}.tmp"),
+                                os.path.join(folder, f"IMG_{frame_index}_{timestamp}.{suffix}"))
+        if not files:
+            print(f"Invalid save format: {save_format}, saving JPEG")
+            return self._plan(buffer, now, frame_index, telemetry, "jpeg")
+        return {"kind": "image", "files": files, "label": ", ".join(final for _, final in files.values())}
+
+    def _raw_writer(self, folder):
+        writer = self.raw_writers.get(folder)
+        if writer is None:
+            # Frames of the previous transect may still be finishing, so only close older writers
+            while len(self.raw_writers) >= 2:
+                self.raw_writers.pop(next(iter(self.raw_writers))).close()
+            writer = self.raw_writers[folder] = RawFrameWriter(folder, self.raw_chunk_bytes)
+            print(f"Recording raw frames to {writer.folder}")
+        return writer
+
+    def _finish(self, ticket, plan):
+        """Record a finished ticket and commit every frame whose predecessors are all done. plan is None if nothing was written."""
+        with self.commit_lock:
+            self.finished[ticket] = plan
+            while self.next_commit in self.finished:
+                plan = self.finished.pop(self.next_commit)
+                self.next_commit += 1
+                if plan:
+                    self._commit(plan)
+
+    def _commit(self, plan):
+        try:
+            if plan["kind"] == "raw":
+                self.raw_writers[plan["folder"]].commit(plan["record"])
+            else:
+                for temp_path, final_path in plan["files"].values():
+                    os.replace(temp_path, final_path)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error committing {plan['label']}: {e}")
+            self.pipeline.metrics["save"].record_error()
+
+    def _telemetry(self, telemetry):
+        include_telemetry = self.pipeline.app_settings.get('exif_telemetry', False)
+        return telemetry if include_telemetry and telemetry else None
+
+    def _report(self, worker, label, timings):
+        stats = self.worker_stats.setdefault(worker, {"frames": 0, "errors": 0, "last_ms": {}})
+        stats["frames"] += 1
+        stats["last_ms"] = {name: round(value, 2) for name, value in timings.items()}
+        print(f"Saved {label} (worker {worker}: " +
+              ", ".join(f"{name} {value:.1f} ms" for name, value in timings.items()) + ")")
+
+    def _record_error(self, worker, frame_index, error, plan):
+        print(f"Error saving frame {frame_index}: {error}")
+        self.pipeline.metrics["save"].record_error()
+        stats = self.worker_stats.setdefault(worker, {"frames": 0, "errors": 0, "last_ms": {}})
+        stats["errors"] += 1
+        # A failed raw frame just leaves an unindexed gap in its chunk
+        if plan and plan["kind"] == "image":
+            for temp_path, _ in plan["files"].values():
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def _worker(self, worker_id):
+        while worker_id < self.worker_count:
+            ticket, item, plan = self._take()
+            if item is None:
+                continue
+            buffer, now, frame_index, telemetry = item
+            timings = {}
+            try:
+                start = time.perf_counter()
+                if plan is None:
+                    continue
+                if plan["kind"] == "raw":
+                    self._write_raw(buffer.array, plan, timings)
+                    self.pipeline.metrics["save"].record(time.perf_counter() - start)
+                    self._report(worker_id, plan["label"], timings)
+                    continue
+                files = plan["files"]
+                if "dng" in files:
+                    step = time.perf_counter()
+                    self.dng_writer.write(files["dng"][0], buffer.array, now, self._telemetry(telemetry))
+                    timings["dng"] = self._record("dng", step)
+                if "jpeg" not in files:
+                    self.pipeline.metrics["save"].record(time.perf_counter() - start)
+                    self._report(worker_id, plan["label"], timings)
+                    continue
+                jpeg = self._encode(buffer, frame_index, timings)
+                buffer.release()
+                buffer = None
+
+                step = time.perf_counter()
+                data = self.exif_manager.build_jpeg_with_exif(jpeg, now, self._telemetry(telemetry))
+                timings["exif"] = self._record("exif", step)
+
+                step = time.perf_counter()
+                with open(files["jpeg"][0], 'wb') as f:
+                    f.write(data)
+                timings["write"] = self._record("write", step)
+                self.pipeline.metrics["save"].record(time.perf_counter() - start)
+                self._report(worker_id, plan["label"], timings)
+            except Exception as e:
+                self._record_error(worker_id, frame_index, e, plan)
+                plan = None
+                import traceback
+                traceback.print_exc()
+            finally:
+                if buffer is not None:
+                    buffer.release()
+                self._finish(ticket, plan)
+
+    def _write_raw(self, array, plan, timings):
+        step = time.perf_counter()
+        packed = None
+        if array.dtype == np.uint16:
+            nbytes = frame_layout(array.shape, array.dtype)[1]
+            packed = getattr(self.scratch, "packed", None)
+            if packed is None or packed.size != nbytes:
+                packed = self.scratch.packed = np.empty(nbytes, dtype=np.uint8)
+        payload = encode_frame(array, packed)
+        timings["pack"] = self._record("pack", step)
+        step = time.perf_counter()
+        write_payload(plan["chunk_path"], plan["offset"], payload)
+        timings["write"] = self._record("write", step)
+
+    def _encode(self, buffer, frame_index, timings):
+        rgb = None
+        try:
+            if buffer.array.ndim == 3:
+                # Already demosaiced in the frame callback by the VmbPy backend
+                image = buffer.array
+            else:
+                step = time.perf_counter()
+                rgb = self.pipeline.render(buffer)
+                if rgb is None:
+                    raise RuntimeError(f"No RGB buffer available for frame {frame_index}")
+                image = rgb.array
+                timings["demosaic"] = self._record("demosaic", step)
+            step = time.perf_counter()
+            success, jpeg = cv2.imencode('.jpg', image)
+            if not success:
+                raise RuntimeError(f"JPEG encoding failed for frame {frame_index}")
+            timings["encode"] = self._record("encode", step)
+            return jpeg
+        finally:
+            if rgb:
+                rgb.release()
+
+    def _record(self, name, start):
+        elapsed = time.perf_counter() - start
+        self.metrics[name].record(elapsed)
+        return elapsed * 1000
+
+    @staticmethod
+    def _source(buffer):
+        """Describe where a worker process finds a queued frame without copying it when possible"""
+        pool = getattr(buffer, "pool", None)
+        if pool is not None and pool.shared_memory is not None:
+            return ("shared",) + buffer.describe()
+        if hasattr(buffer, "path"):
+            return ("file", buffer.path)
+        return ("array", buffer.array)
+
+    def _dispatch(self):
+        while True:
+            # Leave frames in the save queue, where the overflow policy applies, until a process can take them
+            self.in_flight.acquire()
+            ticket, item, plan = self._take()
+            if item is None:
+                self.in_flight.release()
+                continue
+            buffer, now, frame_index, telemetry = item
+            if plan is None:
+                buffer.release()
+                self.in_flight.release()
+                self._finish(ticket, None)
+                continue
+            job = {
+                "ticket": ticket,
+                "frame_index": frame_index,
+                "plan": plan,
+                "source": self._source(buffer),
+                "tone_curve": self.pipeline.tone_mapper.curve_key,
+                "backend": self.pipeline.save_backend,
+                "now": now,
+                "telemetry": self._telemetry(telemetry),
+                "camera_settings": self.exif_manager.get_current_settings()
+            }
+            with self.pending_lock:
+                self.pending[ticket] = (buffer, frame_index, plan, time.monotonic())
+            self.jobs.put(job)
+
+    def _collect(self):
+        while True:
+            try:
+                ticket, worker, timings, error = self.results.get(timeout=1.0)
+            except Empty:
+                self._check_processes()
+                continue
+            with self.pending_lock:
+                job = self.pending.pop(ticket, None)
+            if job is None:
+                continue
+            buffer, frame_index, plan, dispatched = job
+            buffer.release()
+            self.in_flight.release()
+            if error:
+                self._record_error(worker, frame_index, error, plan)
+                plan = None
+            else:
+                for name, value in timings.items():
+                    self.metrics[name].record(value / 1000)
+                self.pipeline.metrics["save"].record(time.monotonic() - dispatched)
+                self._report(worker, plan["label"], timings)
+            self._finish(ticket, plan)
+
+    def _check_processes(self):
+        """Replace dead saver processes and give up on frames that never came back"""
+        for worker_id, process in enumerate(self.processes):
+            if not process.is_alive():
+                print(f"Frame saver process {process.name} exited with {process.exitcode}, restarting")
+                self.processes[worker_id] = self._spawn_process(worker_id)
+
+        now = time.monotonic()
+        with self.pending_lock:
+            expired = [ticket for ticket, job in self.pending.items() if now - job[3] > self.job_timeout]
+            jobs = [(ticket, self.pending.pop(ticket)) for ticket in expired]
+        for ticket, (buffer, frame_index, plan, _) in jobs:
+            buffer.release()
+            self.in_flight.release()
+            self._record_error("lost", frame_index, "no result from saver process", plan)
+            self._finish(ticket, None)
+
+    def get_stats(self):
+        with self.lock:
+            alive = sum(1 for thread in self.threads.values() if thread.is_alive())
+            alive += sum(1 for process in self.processes if process.is_alive())
+        with self.pending_lock:
+            in_flight = len(self.pending)
+        return {
+            "mode": self.started_mode or self.mode,
+            "workers": self.worker_count,
+            "alive": alive,
+            "in_flight": in_flight,
+            "stages": {name: stage.snapshot() for name, stage in self.metrics.items()},
+            "per_worker": {str(worker): dict(stats) for worker, stats in self.worker_stats.items()}
+        }
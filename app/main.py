@@ -1,19 +1,18 @@
 import os
 from flask import Flask, Response, request, jsonify
-from flask_socketio import SocketIO
-from queue import Queue
+from flask_socketio import SocketIO, join_room, leave_room
 import threading
 
 from views import views_bp
 from state_machine import TriggerMode, CameraState, CameraStateMachine
 from camera.camera_hardware_controller import CameraHardwareController
 from camera.camera_application_service import CameraApplicationService
+from camera.frame_pipeline import parse_resolution
 from exif_manager import ExifManager
+from frame_save_queue import FrameSaveQueue
+from frame_saver import FrameSaverPool
 
 from mavlink_handler import MavlinkHandler
-import cv2
-import piexif
-import json
 from datetime import datetime
 
 import subprocess
@@ -27,15 +26,23 @@ mavlink_handler = MavlinkHandler(socketio)
 base_output_dir = "recordings"
 os.makedirs(base_output_dir, exist_ok=True)
 
-frame_save_queue = Queue(maxsize=30)
+frame_save_queue = FrameSaveQueue()
 
 state_machine = CameraStateMachine()
 camera_handler = CameraHardwareController(state_machine, frame_save_queue, mavlink_handler)
 camera_service = CameraApplicationService(state_machine, camera_handler, socketio)
+camera_handler.pipeline.on_drop = lambda stats: socketio.emit('frame_drop', stats)
 
 exif_manager = ExifManager(camera_service.settings_manager, camera_handler)
+frame_saver = FrameSaverPool(frame_save_queue, camera_handler.pipeline, camera_service, exif_manager,
+                             camera_service.settings_manager)
 
-camera_service.settings_manager.apply_current_app_settings(state_machine, camera_handler, mavlink_handler)
+# Applied now and again whenever app_settings.json changes, through the API or on disk
+camera_service.settings_manager.subscribe_app_settings(
+    lambda settings: camera_service.settings_manager.apply_current_app_settings(
+        state_machine, camera_handler, mavlink_handler
+    )
+)
 
 def modify_mtu():
     try:
@@ -62,42 +69,138 @@ def modify_mtu():
         print(f"An error occurred while running sudo commands: {e}")
         exit(1)
 
-def generate_frames():
+def generate_frames(client):
+    """Yield each preview frame delivered to this client's mailbox, at most client.max_fps per second"""
+    broadcaster = camera_handler.pipeline.broadcaster
+    min_interval = 1.0 / client.max_fps if client.max_fps else 0.0
+    last_sent = 0.0
     while True:
-        frame = camera_handler.get_latest_frame()
-        if frame is not None:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        if min_interval:
+            wait = last_sent + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        frame = client.next_frame(timeout=5.0)
+        if frame is None:
+            # Nothing new for a while; resend this client's last frame so dead connections get noticed
+            frame = broadcaster.get_latest_frame(client.roi or client.resolution)
+            if frame is None:
+                continue
+        last_sent = time.monotonic()
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
-def frame_saver_worker():
-    while True:
-        try:
-            image, now, frame_index, telemetry = frame_save_queue.get()
-            timestamp = now.strftime('%Y_%m_%d_%H-%M-%S') + f'-{int(now.microsecond / 10000):02d}'
-            folder = camera_service.current_recording_folder
-            if folder:
-                filename = os.path.join(folder, f"IMG_{frame_index}_{timestamp}.jpg")
-                
-                cv2.imwrite(filename, image)
-                
-                app_settings = camera_service.settings_manager.get_app_settings()
-                include_telemetry = app_settings.get('exif_telemetry', False)
-                
-                if include_telemetry and telemetry and telemetry != {}:
-                    exif_manager.apply_exif_to_file(filename, now, telemetry)
-                    print(f"Saved frame with telemetry to {filename}")
-                else:
-                    exif_manager.apply_exif_to_file(filename, now)
-                    print(f"Saved frame without telemetry to {filename}")
-        except Exception as e:
-            print(f"Error saving frame: {e}")
-            import traceback
-            traceback.print_exc()
+def get_preview_resolution(res):
+    """Validate a requested preview level against the preview_resolution options"""
+    if not res:
+        return None
+    definitions = camera_service.settings_manager.get_app_settings_definitions()
+    for setting in definitions.get("settings", []):
+        if setting["id"] == "preview_resolution" and res in setting.get("options", []):
+            return parse_resolution(res)
+    raise ValueError(f"Unsupported preview resolution: {res}")
+
+def get_preview_fps(fps):
+    """Validate a requested preview frame rate limit, None for no limit"""
+    if fps is None:
+        return None
+    if isinstance(fps, bool) or not isinstance(fps, (int, float)) or not fps > 0:
+        raise ValueError(f"Invalid preview frame rate: {fps}")
+    return float(fps)
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(), 
-                   mimetype='multipart/x-mixed-replace; boundary=frame')
+    max_fps = request.args.get('fps', type=float)
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    try:
+        resolution = get_preview_resolution(request.args.get('res'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    broadcaster = camera_handler.pipeline.broadcaster
+    client = broadcaster.subscribe(max_fps, f"mjpeg {request.remote_addr}", resolution)
+    response = Response(generate_frames(client), 
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(lambda: broadcaster.unsubscribe(client))
+    return response
+
+@app.route('/video_feed/roi')
+def video_feed_roi():
+    max_fps = request.args.get('fps', type=float)
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    try:
+        roi = camera_handler.pipeline.make_roi(
+            request.args.get('x', 0, type=int),
+            request.args.get('y', 0, type=int),
+            request.args.get('w', 1028, type=int),
+            request.args.get('h', 752, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    broadcaster = camera_handler.pipeline.broadcaster
+    client = broadcaster.subscribe(max_fps, f"roi {request.remote_addr}", roi=roi)
+    response = Response(generate_frames(client), 
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(lambda: broadcaster.unsubscribe(client))
+    return response
+
+socket_preview_clients = {}
+socket_preview_lock = threading.Lock()
+
+def socket_preview_sender(sid, client, ack_timeout=5.0):
+    """Push preview frames to one Socket.IO client, waiting for its ack before sending the next"""
+    acked = threading.Event()
+    acked.set()
+    min_interval = 1.0 / client.max_fps if client.max_fps else 0.0
+    last_sent = 0.0
+    while not client.closed:
+        if not acked.wait(timeout=ack_timeout):
+            # The frame or its ack was lost; newer frames replaced each other in the mailbox meanwhile, so send the newest
+            print(f"Socket.IO preview client {sid} has not acknowledged for {ack_timeout}s, sending the newest frame")
+            acked.set()
+        if min_interval:
+            wait = last_sent + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        frame = client.next_frame(timeout=ack_timeout)
+        if frame is None:
+            continue
+        # A fresh event per frame, so a late ack for a frame given up on cannot release the next one early
+        acked = threading.Event()
+        last_sent = time.monotonic()
+        socketio.emit('preview_frame', frame, to=f"preview_{sid}", callback=lambda *args, acked=acked: acked.set())
+
+def stop_socket_preview(sid):
+    with socket_preview_lock:
+        client = socket_preview_clients.pop(sid, None)
+    if client:
+        camera_handler.pipeline.broadcaster.unsubscribe(client)
+
+@socketio.on('preview_subscribe')
+def handle_preview_subscribe(data=None):
+    sid = request.sid
+    data = data or {}
+    try:
+        max_fps = get_preview_fps(data.get('fps'))
+        resolution = get_preview_resolution(data.get('res'))
+    except ValueError as e:
+        socketio.emit('camera_error', {'message': str(e)}, to=sid)
+        return
+    stop_socket_preview(sid)
+    join_room(f"preview_{sid}")
+    client = camera_handler.pipeline.broadcaster.subscribe(max_fps, f"socketio {request.remote_addr}", resolution)
+    with socket_preview_lock:
+        socket_preview_clients[sid] = client
+    socketio.start_background_task(socket_preview_sender, sid, client)
+
+@socketio.on('preview_unsubscribe')
+def handle_preview_unsubscribe(data=None):
+    leave_room(f"preview_{request.sid}")
+    stop_socket_preview(request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    stop_socket_preview(request.sid)
 
 @app.route('/api/state', methods=['GET'])
 def get_state():
@@ -138,6 +241,32 @@ def update_camera_settings():
     result = camera_service.update_camera_settings(data)
     return jsonify(result)
     
+@app.route('/api/pipeline/metrics', methods=['GET'])
+def get_pipeline_metrics():
+    return jsonify({
+        'success': True,
+        'metrics': camera_handler.pipeline.get_metrics(),
+        'saver': frame_saver.get_stats(),
+        'stream': camera_handler.get_stream_stats(),
+        'trigger': camera_handler.get_trigger_stats()
+    })
+
+@app.route('/api/preview/clients', methods=['GET'])
+def get_preview_clients():
+    return jsonify({
+        'success': True,
+        'preview': camera_handler.pipeline.broadcaster.get_stats()
+    })
+
+@app.route('/api/save_queue', methods=['GET'])
+def get_save_queue_status():
+    return jsonify({
+        'success': True,
+        'save_queue': frame_save_queue.get_status(),
+        'drops': camera_handler.pipeline.drop_stats.snapshot(),
+        'overflow_policy': camera_handler.pipeline.overflow_policy
+    })
+
 @app.route('/api/telemetry', methods=['GET'])
 def get_telemetry():
     return jsonify({
@@ -171,10 +300,6 @@ def update_app_settings():
     try:
         data = request.get_json()
         success, message = camera_service.settings_manager.update_app_settings(data)
-    
-        camera_service.settings_manager.apply_current_app_settings(
-            state_machine, camera_handler, mavlink_handler
-        )
         
         return jsonify({"success": success, "message": message})
     except Exception as e:
@@ -234,21 +359,14 @@ def apply_camera_settings_progressive():
 def apply_settings_progressively(settings):
     try:
         settings_list = []
+        registry = camera_service.settings_manager.get_parameter_registry()
         
         # Convert dictionary to list of items with id
         for key, value in settings.items():
             # Get parameter name from definitions (fallback to key if not found)
-            param_name = key
-            
-            # Fix: Use get_parameters_definitions() instead of non-existent get_params()
-            for param in camera_service.settings_manager.get_parameters_definitions().get("parameters", []):
-                if param.get('id') == key:
-                    param_name = param.get('name', key)
-                    break
-                
             settings_list.append({
                 'id': key,
-                'name': param_name,
+                'name': registry.get_name(key),
                 'value': value
             })
         
@@ -290,7 +408,7 @@ def handle_source_maps(path):
 
 if __name__ == '__main__':
     # modify_mtu()
-    threading.Thread(target=frame_saver_worker, daemon=True).start()
+    frame_saver.start()
     mavlink_handler.start_mavlink_thread()
     camera_handler.start_camera_thread()
     socketio.run(app, host='0.0.0.0', port=80, debug=True, use_reloader=False, allow_unsafe_werkzeug=True)
@@ -0,0 +1,198 @@
+"""Append-only container for raw Bayer frames recorded during a transect.
+
+A transect's raw/ folder holds chunk files of page-aligned frame payloads
+and an index.jsonl file with one line per frame giving its chunk, offset,
+geometry, trigger time and telemetry. Offsets are reserved in frame order, so
+several workers can write payloads at once while the index is appended in
+order. A frame without an index line was never finished and is ignored.
+
+Convert a recorded transect to JPEG later with:
+    python raw_container.py TRANSECT_FOLDER [--out DIR]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+from datetime import datetime
+import numpy as np
+from camera.bayer_packing import pack12, packed12_size, unpack12
+
+
+CHUNK_MAGIC = b"AVTRAW01"
+HEADER_BYTES = 4096
+ALIGNMENT = 4096
+RAW_FOLDER = "raw"
+INDEX_NAME = "index.jsonl"
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def frame_layout(shape, dtype):
+    """Storage format name and payload size of a raw frame"""
+    pixels = int(np.prod(shape))
+    if np.dtype(dtype) == np.uint16:
+        return "12p", packed12_size(pixels)
+    return "8", pixels
+
+
+def encode_frame(array, out=None):
+    """Payload bytes of a raw frame: 12-bit frames are packed, 8-bit frames stored as they are"""
+    if array.dtype == np.uint16:
+        return pack12(array, out)
+    return np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+
+
+def write_payload(chunk_path, offset, payload):
+    """Write a frame payload at its reserved offset. Safe to call from any thread or process."""
+    fd = os.open(chunk_path, os.O_WRONLY)
+    try:
+        view = memoryview(payload).cast('B')
+        written = 0
+        while written < len(view):
+            written += os.pwrite(fd, view[written:], offset + written)
+    finally:
+        os.close(fd)
+
+
+class RawFrameWriter:
+    """Reserves space for frames in chunk files and appends their index records in order"""
+    def __init__(self, transect_folder, chunk_bytes=1024 * 1024 * 1024):
+        self.folder = os.path.join(transect_folder, RAW_FOLDER)
+        os.makedirs(self.folder, exist_ok=True)
+        self.chunk_bytes = int(chunk_bytes)
+        self.lock = threading.Lock()
+        self.chunk_number = len([name for name in os.listdir(self.folder) if name.startswith("chunk_")])
+        self.chunk_path = None
+        self.chunk_end = 0
+        self.index_file = open(os.path.join(self.folder, INDEX_NAME), 'a')
+        self.frames = 0
+
+    def _new_chunk(self):
+        self.chunk_path = os.path.join(self.folder, f"chunk_{self.chunk_number:05d}.bin")
+        self.chunk_number += 1
+        with open(self.chunk_path, 'wb') as f:
+            f.write(struct.pack("<8sI", CHUNK_MAGIC, HEADER_BYTES).ljust(HEADER_BYTES, b"\0"))
+        self.chunk_end = HEADER_BYTES
+
+    def reserve(self, nbytes):
+        """Claim space for the next frame. Returns (chunk_path, offset)."""
+        with self.lock:
+            if self.chunk_path is None or (self.chunk_end > HEADER_BYTES and self.chunk_end + nbytes > self.chunk_bytes):
+                self._new_chunk()
+            offset = self.chunk_end
+            self.chunk_end = _align(offset + nbytes)
+            return self.chunk_path, offset
+
+    @staticmethod
+    def make_record(chunk_path, offset, shape, dtype, frame_index, trigger_time, telemetry=None, camera_settings=None):
+        layout, nbytes = frame_layout(shape, dtype)
+        return {
+            "frame_index": frame_index,
+            "chunk": os.path.basename(chunk_path),
+            "offset": offset,
+            "nbytes": nbytes,
+            "width": shape[1],
+            "height": shape[0],
+            "format": layout,
+            "trigger_time": trigger_time.isoformat() if trigger_time else None,
+            "telemetry": telemetry,
+            "camera_settings": camera_settings
+        }
+
+    def commit(self, record):
+        """Append a finished frame to the index; call in frame order"""
+        with self.lock:
+            self.index_file.write(json.dumps(record, default=str) + "\n")
+            self.index_file.flush()
+            self.frames += 1
+
+    def close(self):
+        with self.lock:
+            self.index_file.close()
+
+
+class RawFrameReader:
+    """Random access to the frames of a recorded transect through memory-mapped chunks"""
+    def __init__(self, transect_folder):
+        self.folder = os.path.join(transect_folder, RAW_FOLDER)
+        self.records = []
+        with open(os.path.join(self.folder, INDEX_NAME)) as f:
+            for line in f:
+                try:
+                    self.records.append(json.loads(line))
+                except ValueError:
+                    # A torn last line from a recording that stopped mid-write
+                    break
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _chunk(self, name):
+        chunk = self.chunks.get(name)
+        if chunk is None:
+            chunk = self.chunks[name] = np.memmap(os.path.join(self.folder, name), dtype=np.uint8, mode='r')
+        return chunk
+
+    def payload(self, position):
+        """The stored bytes of a frame as a read-only memory-mapped view"""
+        record = self.records[position]
+        return self._chunk(record["chunk"])[record["offset"]:record["offset"] + record["nbytes"]]
+
+    def frame(self, position, out=None):
+        """The frame as a (height, width) Bayer array: uint16 for 12-bit frames, uint8 otherwise"""
+        record = self.records[position]
+        shape = (record["height"], record["width"])
+        payload = self.payload(position)
+        if record["format"] == "12p":
+            return unpack12(payload, shape, out)
+        return payload.reshape(shape)
+
+    def __getitem__(self, position):
+        return self.frame(position)
+
+
+def convert_to_jpeg(transect_folder, output_folder=None, backend="opencv_bilinear"):
+    """Demosaic every recorded raw frame into IMG_<index>_<timestamp>.jpg files with EXIF"""
+    import cv2
+    from camera.demosaic import demosaic_bayer8
+    from camera.tone_mapping import ToneMapper
+    from exif_manager import ExifManager
+
+    reader = RawFrameReader(transect_folder)
+    output_folder = output_folder or transect_folder
+    os.makedirs(output_folder, exist_ok=True)
+    tone_mapper = ToneMapper()
+    exif_manager = ExifManager(None)
+    for position, record in enumerate(reader.records):
+        bayer = reader.frame(position)
+        bayer8 = np.empty(bayer.shape, dtype=np.uint8)
+        tone_mapper.apply(bayer, bayer8)
+        rgb = demosaic_bayer8(bayer8, np.empty(bayer.shape + (3,), dtype=np.uint8), backend)
+        success, jpeg = cv2.imencode('.jpg', rgb)
+        if not success:
+            print(f"JPEG encoding failed for frame {record['frame_index']}")
+            continue
+        now = datetime.fromisoformat(record["trigger_time"]) if record["trigger_time"] else datetime.now()
+        timestamp = now.strftime('%Y_%m_%d_%H-%M-%S') + f'-{int(now.microsecond / 10000):02d}'
+        data = exif_manager.build_jpeg_with_exif(jpeg, now, record.get("telemetry"), record.get("camera_settings") or {})
+        filename = os.path.join(output_folder, f"IMG_{record['frame_index']}_{timestamp}.jpg")
+        with open(filename, 'wb') as f:
+            f.write(data)
+        print(f"Converted frame {record['frame_index']} to {filename}")
+    return len(reader)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a raw transect recording to JPEG")
+    parser.add_argument("transect", help="Transect folder containing raw/")
+    parser.add_argument("--out", help="Output folder (defaults to the transect folder)")
+    parser.add_argument("--backend", default="opencv_bilinear")
+    args = parser.parse_args()
+    count = convert_to_jpeg(args.transect, args.out, args.backend)
+    print(f"Converted {count} frames")
+    sys.exit(0)
@@ -1,39 +1,206 @@
 import os
 import json
+import copy
+import threading
+import time
 from pathlib import Path
 from state_machine import CameraState, TriggerMode
 
+
+class JsonSettingsStore:
+    """Thread-safe in-memory copy of a JSON settings file.
+
+    The file is parsed once and served from memory. It is re-read only when its
+    mtime changes (checked at most once per check_interval seconds) or when it
+    is written through update(), and subscribers are told about every change.
+    One store exists per file, shared by all SettingsManager instances.
+    """
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path, default, description):
+        with cls._stores_lock:
+            store = cls._stores.get(path)
+            if store is None:
+                store = cls(path, default, description)
+                cls._stores[path] = store
+            return store
+
+    def __init__(self, path, default, description, check_interval=1.0):
+        self.path = path
+        self.default = default
+        self.description = description
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.data = None
+        self.mtime = None
+        self.last_check = 0.0
+        self.subscribers = []
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading {self.description}: {e}")
+            mtime = None
+            data = copy.deepcopy(self.default)
+        self.data = data
+        self.mtime = mtime
+
+    def _is_stale(self):
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except OSError:
+            return self.mtime is not None
+
+    def get(self):
+        """Return the cached data. Callers must not modify it."""
+        changed = False
+        with self.lock:
+            now = time.monotonic()
+            if self.data is None:
+                self._load()
+                self.last_check = now
+            elif now - self.last_check >= self.check_interval:
+                self.last_check = now
+                if self._is_stale():
+                    print(f"{self.description} changed on disk, reloading")
+                    self._load()
+                    changed = True
+            data = self.data
+        if changed:
+            self._notify(data)
+        return data
+
+    def get_copy(self):
+        return copy.deepcopy(self.get())
+
+    def update(self, data):
+        """Write new data to the file and make it the cached copy"""
+        with self.lock:
+            with open(self.path, 'w') as f:
+                json.dump(data, f, indent=4)
+            self.data = data
+            try:
+                self.mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self.mtime = None
+            self.last_check = time.monotonic()
+        self._notify(data)
+
+    def subscribe(self, callback):
+        """Call callback(data) now and whenever the data changes"""
+        with self.lock:
+            self.subscribers.append(callback)
+        callback(self.get())
+
+    def _notify(self, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"Error notifying {self.description} subscriber: {e}")
+
+
+class ParameterRegistry:
+    """Lookup tables over the camera parameter definitions, built once per version of parameters.json"""
+    def __init__(self, definitions):
+        self.parameters = definitions.get("parameters", [])
+        self.by_id = {param["id"]: param for param in self.parameters}
+        self.types = {param["id"]: param.get("type") for param in self.parameters}
+        self.names = {param["id"]: param.get("name", param["id"]) for param in self.parameters}
+        self.writeable = {param["id"]: param.get("writeable", False) for param in self.parameters}
+        self.limits = {
+            param["id"]: (param.get("min"), param.get("max"))
+            for param in self.parameters
+            if param.get("type") == "number"
+        }
+
+    def ids(self):
+        return list(self.by_id)
+
+    def get(self, param_id):
+        return self.by_id.get(param_id)
+
+    def get_type(self, param_id):
+        return self.types.get(param_id)
+
+    def get_name(self, param_id):
+        return self.names.get(param_id, param_id)
+
+    def is_known(self, param_id):
+        return param_id in self.by_id
+
+    def is_writeable(self, param_id):
+        return self.writeable.get(param_id, False)
+
+    def saved_value(self, param_id):
+        param = self.by_id[param_id]
+        return param.get("value", param.get("default"))
+
+    def clamp(self, param_id, value):
+        """Limit a numeric value to the parameter's min/max, if it has them"""
+        if param_id not in self.limits or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value
+        minimum, maximum = self.limits[param_id]
+        if minimum is not None and value < minimum:
+            return minimum
+        if maximum is not None and value > maximum:
+            return maximum
+        return value
+
+
 class SettingsManager:
     def __init__(self):
         base_dir = os.path.dirname(os.path.abspath(__file__))
         self.settings_dir = os.path.join(base_dir, 'settings')
         self.parameters_path = os.path.join(self.settings_dir, 'parameters.json')
         self.app_settings_path = os.path.join(self.settings_dir, 'app_settings.json')
+        self.exif_settings_path = os.path.join(self.settings_dir, 'exif_data.json')
+
+        self.parameters_store = JsonSettingsStore.for_path(
+            self.parameters_path, {"parameters": []}, "camera parameters")
+        self.app_settings_store = JsonSettingsStore.for_path(
+            self.app_settings_path, {"settings": []}, "app settings")
+        self.exif_settings_store = JsonSettingsStore.for_path(
+            self.exif_settings_path, {"camera": {}, "lens": {}, "exposure": {}, "other": {}}, "EXIF settings")
+
+        self.parameter_registry = None
+        self.parameters_store.subscribe(self._rebuild_parameter_registry)
+
+    def _rebuild_parameter_registry(self, definitions):
+        self.parameter_registry = ParameterRegistry(definitions)
+
+    def get_parameter_registry(self):
+        # Reading through the store picks up edits made to parameters.json on disk
+        self.parameters_store.get()
+        return self.parameter_registry
 
     def get_parameters_definitions(self):
-        try:
-            with open(self.parameters_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading camera parameters: {e}")
-            return {"parameters": []}
+        return self.parameters_store.get_copy()
 
     def get_parameter_by_id(self, param_id):
-        params = self.get_parameters_definitions()
-        for param in params.get("parameters", []):
-            if param["id"] == param_id:
-                return param
-        return None
+        param = self.get_parameter_registry().get(param_id)
+        return dict(param) if param else None
     
     def get_adjusted_settings(self, settings):
+        registry = self.get_parameter_registry()
         filtered_settings = {}
 
         for param_id, value in settings.items():
             print(f"Processing setting: {param_id}={value}")
-            param_def = self.get_parameter_by_id(param_id)
-            if param_def and not param_def.get("writeable", False):
-                continue
-            
+            if registry.is_known(param_id):
+                if not registry.is_writeable(param_id):
+                    continue
+                clamped = registry.clamp(param_id, value)
+                if clamped != value:
+                    print(f"Clamped {param_id} from {value} to {clamped}")
+                    value = clamped
         
             filtered_settings[param_id] = value
 
@@ -53,45 +220,31 @@ class SettingsManager:
                     if param["id"] in filtered_settings:
                         param["value"] = filtered_settings[param["id"]]
             
-            with open(self.parameters_path, 'w') as f:
-                json.dump(existing_data, f, indent=4)
+            self.parameters_store.update(existing_data)
             return True
         except Exception as e:
             print(f"Error saving parameters: {e}")
             return False
         
     def get_exif_settings(self):
-        exif_path = os.path.join(self.settings_dir, 'exif_data.json')
-        try:
-            with open(exif_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading EXIF settings: {e}")
-            return {
-                "camera": {}, 
-                "lens": {}, 
-                "exposure": {}, 
-                "other": {}
-            }
+        """Cached EXIF settings, read per frame. Callers must not modify them."""
+        return self.exif_settings_store.get()
 
     def get_app_settings_definitions(self):
-        app_settings_path = os.path.join(self.settings_dir, 'app_settings.json')
-        try:
-            with open(app_settings_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading app settings: {e}")
-            return {"settings": []}
+        return self.app_settings_store.get_copy()
+
+    @staticmethod
+    def _flatten_app_settings(settings_data):
+        return {setting["id"]: setting["value"] for setting in settings_data.get("settings", [])}
 
     def get_app_settings(self):
         """Get all app settings as a dictionary of id:value pairs"""
-        settings_dict = {}
-        settings_data = self.get_app_settings_definitions()
-        
-        for setting in settings_data.get("settings", []):
-            settings_dict[setting["id"]] = setting["value"]
-        
-        return settings_dict
+        return self._flatten_app_settings(self.app_settings_store.get())
+
+    def subscribe_app_settings(self, callback):
+        """Call callback(settings_dict) now and whenever the app settings change"""
+        self.app_settings_store.subscribe(
+            lambda settings_data: callback(self._flatten_app_settings(settings_data)))
 
     def update_app_settings(self, new_settings):
         """Update app settings with provided values"""
@@ -109,9 +262,7 @@ class SettingsManager:
                         setting["value"] = new_settings[setting["id"]]
             
             # Write updated settings back to file
-            app_settings_path = os.path.join(self.settings_dir, 'app_settings.json')
-            with open(app_settings_path, 'w') as f:
-                json.dump(app_settings_data, f, indent=4)
+            self.app_settings_store.update(app_settings_data)
             
             return True, "Settings updated successfully"
         except Exception as e:
@@ -125,15 +276,13 @@ class SettingsManager:
             # Apply triggering mode
             if 'triggering_mode' in app_settings:
                 if app_settings['triggering_mode'] == 'distance':
-                    state_machine.trigger_mode = TriggerMode.DISTANCE
-                    print(f"Triggering mode set to DISTANCE")
+                    state_machine.set_trigger_mode(TriggerMode.DISTANCE)
                     if 'distance_triggering' in app_settings:
                         distance_threshold = float(app_settings['distance_triggering'])
                         mavlink_handler.set_distance_threshold(distance_threshold)
                         print(f"Distance triggering threshold set to {distance_threshold}")
                 else:
-                    state_machine.trigger_mode = TriggerMode.TIME
-                    print(f"Triggering mode set to TIME")
+                    state_machine.set_trigger_mode(TriggerMode.TIME)
 
             # Apply recording frame rate
             if 'recording_frame_rate' in app_settings:
@@ -147,6 +296,17 @@ class SettingsManager:
                 camera_handler.set_preview_interval(1.0 / preview_frame_rate)
                 print(f"Preview frame rate set to {preview_frame_rate} fps")
 
+            # Apply save queue memory budget
+            if 'save_queue_memory_mb' in app_settings:
+                camera_handler.set_save_queue_budget(float(app_settings['save_queue_memory_mb']))
+
+            # Apply save queue overflow policy
+            if 'save_queue_overflow_policy' in app_settings:
+                camera_handler.pipeline.set_overflow_policy(
+                    app_settings['save_queue_overflow_policy'],
+                    app_settings.get('save_queue_block_timeout')
+                )
+
             print("App settings applied successfully.")
         except Exception as e:
             print(f"Error applying app settings: {e}")
@@ -16,7 +16,19 @@ class CameraStateMachine:
         self.state = CameraState.UNAVAILABLE
         self.trigger_mode = TriggerMode.TIME
         self.state_lock = threading.Lock()
+        self.listeners = []
         print(f"Camera initialised in {self.state.name} state")
+
+    def add_listener(self, callback):
+        """Call callback() after every state or trigger mode change"""
+        self.listeners.append(callback)
+
+    def _notify(self):
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error notifying state listener: {e}")
     
     def transition_to(self, new_state):
         with self.state_lock:
@@ -26,7 +38,8 @@ class CameraStateMachine:
             old_state = self.state
             self.state = new_state
             print(f"Camera state changed: {old_state.name} → {new_state.name}")
-            return True
+        self._notify()
+        return True
     
     def get_state(self):
         with self.state_lock:
@@ -72,4 +85,5 @@ class CameraStateMachine:
             
             self.trigger_mode = mode
             print(f"Trigger mode set to: {self.trigger_mode.name}")
-            return True
\ No newline at end of file
+        self._notify()
+        return True
\ No newline at end of file
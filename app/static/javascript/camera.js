@@ -12,13 +12,56 @@ function getState() {
         });
 }
 
+// Preview transport: the multipart /video_feed stream by default, or binary frames
+// over this Socket.IO connection when the page is opened with ?video=socketio.
+// ?res=WIDTHxHEIGHT picks a preview level for this page only
+const pageParams = new URLSearchParams(window.location.search);
+const videoTransport = pageParams.get('video') === 'socketio' ? 'socketio' : 'mjpeg';
+const videoFps = parseFloat(pageParams.get('fps')) || null;
+const videoResolution = pageParams.get('res');
+let previewObjectUrl = null;
+let pendingPreviewAck = null;
+
+function acknowledgePreview() {
+    if (pendingPreviewAck) {
+        const ack = pendingPreviewAck;
+        pendingPreviewAck = null;
+        ack();
+    }
+}
+
+function startSocketPreview(videoFeed) {
+    // Acknowledge only once the frame is displayed so the server never runs ahead of us.
+    // Listeners rather than onload, which other scripts set too; re-adding the same function is a no-op.
+    videoFeed.addEventListener('load', acknowledgePreview);
+    // A frame that fails to decode must not stall the stream
+    videoFeed.addEventListener('error', acknowledgePreview);
+    socket.emit('preview_subscribe', { fps: videoFps, res: videoResolution });
+}
+
+socket.on('preview_frame', function (data, ack) {
+    const videoFeed = document.getElementById('live_feed');
+    if (!videoFeed) {
+        if (ack) ack();
+        return;
+    }
+    if (previewObjectUrl) {
+        URL.revokeObjectURL(previewObjectUrl);
+    }
+    previewObjectUrl = URL.createObjectURL(new Blob([data], { type: 'image/jpeg' }));
+    pendingPreviewAck = ack || null;
+    videoFeed.src = previewObjectUrl;
+});
+
 // Add reconnection handler
 socket.on('connect', function() {
     console.log('Socket connected/reconnected, refreshing state');
     
     // Force reconnection of the video stream
     const videoFeed = document.getElementById('live_feed');
-    if (videoFeed) {
+    if (videoFeed && videoTransport === 'socketio') {
+        startSocketPreview(videoFeed);
+    } else if (videoFeed) {
         const currentSrc = videoFeed.src;
         videoFeed.src = '';  // Disconnect current stream
         setTimeout(() => {
@@ -7,6 +7,10 @@ document.addEventListener('DOMContentLoaded', function () {
         updateButtonState(data.state);
         currentState = data.state; // Update current state
 
+        if (data.state === 'WRITE' && document.getElementById('droppedFrames')) {
+            refreshDroppedFrames();
+        }
+
         // Update the UI elements based on state
         if (data.folder) {
             const folderNameInput = document.getElementById('folderNameInput');
@@ -16,6 +20,32 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    socket.on('frame_drop', function (data) {
+        updateDroppedFrames(data);
+    });
+
+    function updateDroppedFrames(drops) {
+        const droppedDisplay = document.getElementById('droppedFrames');
+        if (droppedDisplay && drops) {
+            droppedDisplay.textContent = drops.dropped;
+            droppedDisplay.className = drops.dropped > 0 ? 'text-warning' : '';
+        }
+    }
+
+    function refreshDroppedFrames() {
+        fetch('/api/save_queue')
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    updateDroppedFrames(data.drops);
+                }
+            });
+    }
+
+    if (document.getElementById('droppedFrames')) {
+        refreshDroppedFrames();
+    }
+
     // Handle video feed load events
     const videoFeed = document.getElementById('live_feed');
     if (videoFeed) {
@@ -24,9 +54,9 @@ document.addEventListener('DOMContentLoaded', function () {
             hideLoadingIndicator();
         } else {
             // Listen for the load event
-            videoFeed.onload = function () {
+            videoFeed.addEventListener('load', function () {
                 hideLoadingIndicator();
-            };
+            });
 
             // Safety timeout - hide loading after 10 seconds regardless
             setTimeout(function () {